@@ -6,6 +6,7 @@ de texto extraído de documentos PDF mediante OCR.
 """
 
 import re
+from typing import List
 
 
 def limpiar_texto(texto: str) -> str:
@@ -63,4 +64,24 @@ def limpiar_texto(texto: str) -> str:
     # Normalizar espacios nuevamente y eliminar espacios al inicio/final
     texto_limpio = re.sub(r'\s+', ' ', texto_limpio).strip()
 
-    return texto_limpio
\ No newline at end of file
+    return texto_limpio
+
+
+def limpiar_textos(textos: List[str]) -> List[str]:
+    """
+    Aplica limpiar_texto a una lista de textos, conservando el orden.
+
+    Es la unidad de trabajo del endpoint por lotes: una sola llamada por
+    bloque de textos, pensada para ejecutarse en un proceso del pool.
+
+    Args:
+        textos (List[str]): Textos a limpiar.
+
+    Returns:
+        List[str]: Textos limpios, en el mismo orden de entrada.
+
+    Examples:
+        >>> limpiar_textos(["HÓLA  MUNDO!!!", ""])
+        ['hóla mundo', '']
+    """
+    return [limpiar_texto(t) for t in textos]
@@ -2,7 +2,7 @@
 import re
 import unicodedata
 from difflib import SequenceMatcher
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Tuple
 
 # Stopwords típicas que aparecen en nombres compuestos
 NAME_STOPWORDS = {"de", "del", "la", "las", "los", "y", "da", "das", "do", "dos"}
@@ -169,3 +169,48 @@ def verificar_persona(nombre: str, documento: str, texto_limpio: str) -> Dict[st
         "documento_encontrado": doc_info.get("numero_encontrado")
     }
 
+
+
+def verificar_candidatos_por_pagina(
+    paginas: Iterable[Tuple[int, str]],
+    candidatos: List[Dict[str, str]],
+    umbral: int = 60,
+    detener_anticipadamente: bool = True,
+) -> Dict[str, Any]:
+    """
+    Evalúa varios candidatos {nombre, documento} sobre el texto de un documento
+    que llega página por página (p. ej. desde el OCR).
+
+    Tras cada página se recalcula verificar_persona sobre el texto acumulado;
+    'pagina' es la primera página en la que el candidato alcanzó 'umbral'.
+    Si todos los candidatos lo alcanzan se deja de consumir 'paginas', de modo
+    que las páginas restantes ni siquiera se procesan.
+    """
+    resultados = [
+        {"nombre": c["nombre"], "documento": c["documento"], "aprobado": False, "pagina": None,
+         **verificar_persona(c["nombre"], c["documento"], "")}
+        for c in candidatos
+    ]
+    textos: List[str] = []
+    procesadas, detenido = 0, False
+
+    for numero, texto in paginas:
+        procesadas += 1
+        textos.append(limpiar_texto_validacion(texto))
+        acumulado = " ".join(textos)
+        for res in resultados:
+            if res["aprobado"]:
+                continue
+            res.update(verificar_persona(res["nombre"], res["documento"], acumulado))
+            if res["score"] >= umbral:
+                res["aprobado"], res["pagina"] = True, numero
+        if detener_anticipadamente and resultados and all(r["aprobado"] for r in resultados):
+            detenido = True
+            break
+
+    return {
+        "umbral": umbral,
+        "paginas_procesadas": procesadas,
+        "detenido_anticipadamente": detenido,
+        "resultados": resultados,
+    }
@@ -0,0 +1,286 @@
+"""
+Ingesta en streaming del cuerpo JSON de /merge-pdf-json.
+
+El cuerpo {"files": [{"name", "data_b64", ...}], ...} se analiza a medida que
+llega: cada 'data_b64' se decodifica de base64 por bloques directamente a un
+SpooledTemporaryFile (memoria hasta INGEST_SPOOL_MAX_BYTES, luego disco), sin
+mantener a la vez el texto JSON, el str de Python y los bytes decodificados.
+El resto del documento se reconstruye como un objeto Python pequeño, con
+'data_b64' vacío, para validarlo con el modelo pydantic de siempre.
+"""
+
+import asyncio
+import binascii
+import codecs
+import json
+import os
+import re
+from tempfile import SpooledTemporaryFile
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, List, Optional, Sequence, Tuple
+
+from .merge import PdfMergeError, read_pdf
+
+if TYPE_CHECKING:
+    from pypdf import PdfReader
+
+INGEST_SPOOL_MAX_BYTES = int(os.getenv("INGEST_SPOOL_MAX_BYTES", str(1024 * 1024)))
+
+# Cuerpo de un string JSON hasta la próxima comilla sin escapar (o fin del buffer).
+_STRING_BODY_RE = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*')
+_LITERAL_RE = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null')
+_TOKEN_END_RE = re.compile(r'[^\s,\]}]*')
+_NOT_B64_RE = re.compile(r'[^A-Za-z0-9+/=]')
+_SPACE_RE = re.compile(r'\s+')
+# Un escape JSON; "\u" con menos de 4 dígitos o "\" solo solo son válidos al final de un bloque.
+_ESCAPE_RE = re.compile(r'\\(u[0-9A-Fa-f]{0,4}|.?)', re.DOTALL)
+_SIMPLE_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+# Largo máximo de un número/literal; se aplica igual sin importar cómo llegue partido el cuerpo.
+_MAX_LITERAL_CHARS = 1024
+_WS = " \t\r\n"
+
+
+class JsonStreamError(ValueError):
+    pass
+
+
+class Base64Spool:
+    """Decodifica base64 incrementalmente hacia un archivo temporal."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.file: BinaryIO = SpooledTemporaryFile(max_size=INGEST_SPOOL_MAX_BYTES)
+        self.error: Optional[str] = None
+        self._pending = ""
+        self._raw_pending = ""  # escape cortado entre bloques
+
+    def _unescape(self, raw: str) -> Optional[str]:
+        """Resuelve los escapes JSON del fragmento; None si hay un escape inválido."""
+        out, pos = [], 0
+        for m in _ESCAPE_RE.finditer(raw):
+            out.append(raw[pos:m.start()])
+            esc, pos = m.group(1), m.end()
+            if esc[:1] == "u" and len(esc) == 5:
+                out.append(chr(int(esc[1:], 16)))
+            elif esc in _SIMPLE_ESCAPES:
+                out.append(_SIMPLE_ESCAPES[esc])
+            elif m.end() == len(raw) and (esc == "" or esc[:1] == "u"):
+                self._raw_pending = raw[m.start():]
+            else:
+                return None
+        out.append(raw[pos:])
+        return "".join(out)
+
+    def write(self, raw: str) -> None:
+        if self.error:
+            return
+        raw, self._raw_pending = self._raw_pending + raw, ""
+        chars = self._unescape(raw)
+        if chars is None:
+            self.error = "'data_b64' tiene un escape JSON inválido."
+            return
+        # Se toleran saltos de línea y espacios (base64 estilo MIME); cualquier otro carácter es un error.
+        text = self._pending + _SPACE_RE.sub("", chars)
+        if _NOT_B64_RE.search(text):
+            self.error = "'data_b64' no es base64 válido."
+            return
+        cut = len(text) - len(text) % 4
+        self._pending = text[cut:]
+        if cut:
+            try:
+                self.file.write(binascii.a2b_base64(text[:cut]))
+            except binascii.Error:
+                self.error = "'data_b64' no es base64 válido."
+
+    def close(self) -> None:
+        if (self._pending or self._raw_pending) and not self.error:
+            self.error = "'data_b64' no es base64 válido."
+        self.file.seek(0)
+
+
+class MergeJsonStreamParser:
+    """
+    Analizador JSON incremental (push) que desvía files[i].data_b64 a Base64Spool.
+
+    Uso: feed(chunk) por cada bloque recibido y luego close() -> (objeto, spools),
+    donde spools[i] corresponde a files[i].
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._stack: List[list] = []  # [contenedor, clave_actual]
+        self._expect = "value"
+        self._root: Any = None
+        self._string: Optional[list] = None  # fragmentos crudos del string en curso
+        self._string_is_key = False
+        self._sink: Optional[Base64Spool] = None
+        self.spools: Dict[int, Base64Spool] = {}
+
+    def feed(self, chunk: bytes) -> None:
+        self._buf += self._decoder.decode(chunk)
+        self._consume(final=False)
+
+    def close(self) -> Tuple[Any, List[Base64Spool]]:
+        self._buf += self._decoder.decode(b"", final=True)
+        self._consume(final=True)
+        if self._expect != "done" or self._string is not None:
+            raise JsonStreamError("JSON incompleto.")
+        spools = [self.spools[i] for i in sorted(self.spools)]
+        for spool in spools:
+            spool.close()
+        return self._root, spools
+
+    # --- estado interno ---
+    def _put(self, value: Any) -> None:
+        if not self._stack:
+            self._root = value
+            return
+        frame = self._stack[-1]
+        if isinstance(frame[0], list):
+            frame[0].append(value)
+        else:
+            frame[0][frame[1]] = value
+
+    def _after_value(self) -> None:
+        self._expect = "comma_or_end" if self._stack else "done"
+
+    def _is_data_b64(self) -> Optional[int]:
+        s = self._stack
+        if (len(s) == 3 and isinstance(s[0][0], dict) and s[0][1] == "files"
+                and isinstance(s[1][0], list) and isinstance(s[2][0], dict) and s[2][1] == "data_b64"):
+            return len(s[1][0]) - 1
+        return None
+
+    def _consume(self, final: bool) -> None:
+        buf, pos, n = self._buf, 0, len(self._buf)
+        while pos < n:
+            if self._string is not None:
+                m = _STRING_BODY_RE.match(buf, pos)
+                raw, pos = m.group(), m.end()
+                if self._sink is not None:
+                    self._sink.write(raw)
+                else:
+                    self._string.append(raw)
+                if pos < n and buf[pos] == '"':
+                    pos += 1
+                    self._end_string()
+                    continue
+                break  # fin del buffer: puede quedar un "\" pendiente
+            c = buf[pos]
+            if c in _WS:
+                pos += 1
+            elif c == '"':
+                if self._expect in ("key", "key_or_end"):
+                    self._string_is_key = True
+                elif self._expect in ("value", "value_or_end"):
+                    self._string_is_key = False
+                    index = self._is_data_b64()
+                    if index is not None:
+                        if index in self.spools:
+                            # Un segundo data_b64 pisaría el archivo del primero sin cerrarlo.
+                            raise JsonStreamError(f"files[{index}] tiene 'data_b64' duplicado.")
+                        self._sink = self.spools[index] = Base64Spool(index)
+                else:
+                    raise JsonStreamError(f"Comilla inesperada en la posición {pos}.")
+                self._string = []
+                pos += 1
+            elif c in "{[":
+                if self._expect not in ("value", "value_or_end"):
+                    raise JsonStreamError(f"'{c}' inesperado.")
+                container: Any = {} if c == "{" else []
+                self._put(container)
+                self._stack.append([container, None])
+                self._expect = "key_or_end" if c == "{" else "value_or_end"
+                pos += 1
+            elif c in "}]":
+                top = self._stack[-1][0] if self._stack else None
+                ok_type = isinstance(top, dict) if c == "}" else isinstance(top, list)
+                ok_state = self._expect in ("comma_or_end", "key_or_end" if c == "}" else "value_or_end")
+                if not (ok_type and ok_state):
+                    raise JsonStreamError(f"'{c}' inesperado.")
+                self._stack.pop()
+                self._after_value()
+                pos += 1
+            elif c == ",":
+                if self._expect != "comma_or_end":
+                    raise JsonStreamError("',' inesperada.")
+                self._expect = "key" if isinstance(self._stack[-1][0], dict) else "value"
+                pos += 1
+            elif c == ":":
+                if self._expect != "colon":
+                    raise JsonStreamError("':' inesperado.")
+                self._expect = "value"
+                pos += 1
+            else:
+                if self._expect not in ("value", "value_or_end"):
+                    raise JsonStreamError(f"Carácter inesperado '{c}'.")
+                end = _TOKEN_END_RE.match(buf, pos).end()
+                if end - pos > _MAX_LITERAL_CHARS:
+                    raise JsonStreamError(f"Valor inválido en la posición {pos}.")
+                if end == n and not final:
+                    break  # literal cortado entre bloques
+                if not _LITERAL_RE.fullmatch(buf, pos, end):
+                    raise JsonStreamError(f"Valor inválido en la posición {pos}.")
+                try:
+                    value = json.loads(buf[pos:end])
+                except ValueError:
+                    raise JsonStreamError(f"Valor inválido en la posición {pos}.")
+                self._put(value)
+                self._after_value()
+                pos = end
+        self._buf = buf[pos:]
+
+    def _end_string(self) -> None:
+        if self._sink is not None:
+            self._put("")
+            self._sink = None
+            self._after_value()
+        else:
+            try:
+                value = json.loads('"' + "".join(self._string) + '"')
+            except ValueError:
+                raise JsonStreamError("String JSON inválido.")
+            if self._string_is_key:
+                self._stack[-1][1] = value
+                self._expect = "colon"
+            else:
+                self._put(value)
+                self._after_value()
+        self._string = None
+
+
+def inspect_pdf(index: int, name: Optional[str], src: BinaryIO) -> Tuple[Dict[str, Any], Optional["PdfReader"]]:
+    """
+    Valida un PDF decodificado y devuelve (entrada del reporte por archivo, lector).
+    El lector se reutiliza para la fusión, así cada PDF se analiza una sola vez.
+    """
+    entry: Dict[str, Any] = {"index": index, "name": name, "ok": False,
+                             "pages": None, "encrypted": None, "error": None}
+    try:
+        reader = read_pdf(src)
+        entry.update(pages=len(reader.pages), encrypted=bool(reader.is_encrypted))
+        if not entry["pages"]:
+            raise PdfMergeError("No se encontraron páginas válidas.")
+    except PdfMergeError as e:
+        entry["error"] = str(e)
+        return entry, None
+    entry["ok"] = True
+    return entry, reader
+
+
+async def inspect_pdfs(
+    sources: Sequence[Tuple[Optional[str], Optional[BinaryIO], Optional[str]]],
+) -> Tuple[List[Dict[str, Any]], List[Optional["PdfReader"]]]:
+    """
+    Valida en paralelo (un hilo por archivo) una lista de (nombre, archivo, error_previo).
+    Las entradas con error_previo (p. ej. base64 inválido) no se analizan.
+    Devuelve (reporte por archivo, lectores) en el orden recibido.
+    """
+    async def one(index: int, name: Optional[str], src: Optional[BinaryIO], error: Optional[str]):
+        if error or src is None:
+            return {"index": index, "name": name, "ok": False, "pages": None,
+                    "encrypted": None, "error": error or "Archivo ausente."}, None
+        return await asyncio.to_thread(inspect_pdf, index, name, src)
+
+    results = await asyncio.gather(*(one(i, *source) for i, source in enumerate(sources)))
+    return [entry for entry, _ in results], [reader for _, reader in results]
@@ -1,64 +1,261 @@
 import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
 import os
-
-from fastapi import FastAPI, File, UploadFile, HTTPException, Body
-from fastapi.responses import JSONResponse, StreamingResponse
-from pydantic import BaseModel
-from pdf2image import convert_from_bytes, pdfinfo_from_bytes
-from typing import List, Optional
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Body, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+from typing import Iterator, List, Optional
 from io import BytesIO
-import pytesseract
 import base64
 
 
-from .funciones import limpiar_texto
-from .merge import merge_pdfs_from_uploadfiles, PdfMergeError, merge_pdfs_from_bytes
-from .funcionesValidacionAnexos import verificar_persona 
-
-app = FastAPI(title="API OCR/Limpieza/Merge PDF")
+from .funciones import limpiar_texto, limpiar_textos
+from . import ocr
+from .ocr import LAYOUT_FORMATS, OcrProfile, ocr_image
+from .merge import PdfMergeError, merge_pdf_readers
+from .ingest import JsonStreamError, MergeJsonStreamParser, inspect_pdfs
+from .funcionesValidacionAnexos import verificar_persona, verificar_candidatos_por_pagina
+from . import merge_sessions
+from .merge_sessions import MergeSessionFinalized, MergeSessionNotFound
+from . import singleflight
+from .singleflight import SingleFlightTimeout
+from . import render
+from .render import spool_pdf
 
 PDF_DPI = int(os.getenv("PDF_DPI", "150"))
 MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", "20"))
 OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", "1"))
 OCR_QUEUE_TIMEOUT_SECONDS = int(os.getenv("OCR_QUEUE_TIMEOUT_SECONDS", "20"))
 TESSERACT_TIMEOUT_SECONDS = int(os.getenv("TESSERACT_TIMEOUT_SECONDS", "60"))
+# Plazo total de una petición OCR (cola + todas las páginas); debe quedar bajo el --timeout de gunicorn.
+OCR_REQUEST_DEADLINE_SECONDS = int(os.getenv("OCR_REQUEST_DEADLINE_SECONDS", "240"))
+# DPI del único reintento de una página que agotó su tiempo.
+OCR_RETRY_DPI = int(os.getenv("OCR_RETRY_DPI", "100"))
+# Une peticiones idénticas en curso (mismo PDF y parámetros) en un solo OCR (ver app/singleflight.py).
+OCR_SINGLEFLIGHT = os.getenv("OCR_SINGLEFLIGHT", "1") == "1"
+
+OCR_WARMUP = os.getenv("OCR_WARMUP", "0") == "1"
+# Perfiles a precalentar (separados por coma); por defecto solo el perfil por defecto.
+OCR_WARMUP_PROFILES = [p for p in os.getenv("OCR_WARMUP_PROFILES", "").split(",") if p]
+
+# Limpieza por lotes: a partir de este total de caracteres se usa un pool de procesos.
+LIMPIEZA_POOL_MIN_CHARS = int(os.getenv("LIMPIEZA_POOL_MIN_CHARS", "200000"))
+LIMPIEZA_POOL_WORKERS = int(os.getenv("LIMPIEZA_POOL_WORKERS", "2"))
+LIMPIEZA_MAX_TEXTOS = int(os.getenv("LIMPIEZA_MAX_TEXTOS", "5000"))
 
 ocr_semaphore = asyncio.Semaphore(max(1, OCR_CONCURRENCY))
+limpieza_pool: Optional[ProcessPoolExecutor] = None
+logger = logging.getLogger(__name__)
+
+# Estado de arranque de este worker, expuesto en GET /ready.
+warmup_state = {"ready": False, "warmup": "pendiente", "seconds": None}
+
+
+def build_warmup_pdf() -> bytes:
+    """PDF mínimo de una página con texto, para ejercitar Poppler y Tesseract al arrancar."""
+    content = b"BT /F1 24 Tf 10 20 Td (OCR 123) Tj ET"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 60] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def warm_up_engines() -> None:
+    """Carga los módulos pesados, comprueba los idiomas de los perfiles y ejecuta un OCR completo sobre build_warmup_pdf()."""
+    import pypdf  # noqa: F401  (fusión de PDFs)
+
+    ocr.check_profile_languages()
+
+    pdf_bytes = build_warmup_pdf()
+    for name in OCR_WARMUP_PROFILES or [None]:
+        extract_text_from_pdf_bytes(pdf_bytes, profile=ocr.get_profile(name))
+
+
+async def run_warmup() -> None:
+    start = time.monotonic()
+    try:
+        # Ocupa un cupo de OCR para no sumar un tesseract extra a una petición real.
+        async with ocr_semaphore:
+            await asyncio.to_thread(warm_up_engines)
+        warmup_state["warmup"] = "ok"
+    except Exception as e:
+        # Sin Poppler/Tesseract el servicio igual sirve limpieza, verificación y fusión.
+        logger.warning("Falló el precalentamiento de OCR: %s", e)
+        warmup_state["warmup"] = f"error: {e}"
+    finally:
+        warmup_state["seconds"] = round(time.monotonic() - start, 3)
+        warmup_state["ready"] = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global limpieza_pool
+    # Los idiomas de los perfiles se comprueban en el precalentamiento o con el primer get_profile.
+    warmup_task = None
+    if OCR_WARMUP:
+        # En segundo plano: el worker acepta conexiones y /ready responde 503 hasta terminar.
+        warmup_state.update(ready=False, warmup="en curso", seconds=None)
+        warmup_task = asyncio.create_task(run_warmup())
+    else:
+        warmup_state.update(ready=True, warmup="omitido")
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    if limpieza_pool is not None:
+        limpieza_pool.shutdown(wait=False, cancel_futures=True)
+        # Un nuevo ciclo de lifespan (p. ej. otro TestClient) crea un pool nuevo al necesitarlo.
+        limpieza_pool = None
+
+
+app = FastAPI(title="API OCR/Limpieza/Merge PDF", lifespan=lifespan)
 
 
 class PdfTooLargeError(Exception):
     pass
 
 
-def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> list[dict]:
-    if not pdf_bytes:
+def check_pdf_pages(pdf_path: str) -> int:
+    """Valida el PDF antes del OCR y devuelve su número de páginas."""
+    if os.path.getsize(pdf_path) == 0:
         raise ValueError("El archivo PDF está vacío.")
 
-    pdf_info = pdfinfo_from_bytes(pdf_bytes)
-    total_pages = int(pdf_info.get("Pages", 0))
+    total_pages = render.pdf_page_count(pdf_path)
     if total_pages > MAX_PDF_PAGES:
         raise PdfTooLargeError(
             f"El PDF tiene {total_pages} páginas; el máximo permitido es {MAX_PDF_PAGES}."
         )
-
-    images = convert_from_bytes(pdf_bytes, dpi=PDF_DPI)
-    ocr_results = []
-
-    for i, image in enumerate(images):
-        gray = image.convert("L")
-        text = pytesseract.image_to_string(
-            gray,
-            timeout=TESSERACT_TIMEOUT_SECONDS,
-        )
-        ocr_results.append({
-            "page": i + 1,
-            "text": text.strip()
-        })
-
-    return ocr_results
-
-
-async def run_limited_ocr(pdf_bytes: bytes) -> list[dict]:
+    return total_pages
+
+
+def is_timeout_error(e: Exception) -> bool:
+    """Timeouts de pytesseract (RuntimeError) y de pdf2image (PDFPopplerTimeoutError)."""
+    return "timeout" in f"{type(e).__name__} {e}".lower()
+
+
+def ocr_page(
+    pdf_path: str,
+    page: int,
+    dpi: int,
+    timeout: float,
+    layout: Optional[str],
+    profile: OcrProfile,
+) -> dict:
+    start = time.monotonic()
+    # Poppler escribe la página en gris (PGM) y Tesseract lee ese mismo archivo.
+    with render.render_page_gray(pdf_path, page, dpi, max(1, int(timeout))) as image_path:
+        # Tesseract solo dispone de lo que quedó del presupuesto de la página tras el render.
+        remaining = max(1, int(timeout - (time.monotonic() - start)))
+        return ocr_image(image_path, remaining, layout, profile)
+
+
+def iter_ocr_pages(
+    pdf_path: str,
+    total_pages: int,
+    layout: Optional[str] = None,
+    profile: Optional[OcrProfile] = None,
+    deadline: Optional[float] = None,
+) -> Iterator[dict]:
+    """
+    Renderiza y procesa una página a la vez, así quien consume el iterador puede
+    detenerse antes (ver /validar-documento) sin renderizar el resto del PDF.
+
+    Cada página tiene un presupuesto de min(TESSERACT_TIMEOUT_SECONDS, tiempo
+    restante hasta 'deadline'). Si se agota se reintenta una vez a OCR_RETRY_DPI;
+    si vuelve a fallar la página se entrega con status "timeout" y el resto del
+    documento continúa. Las páginas que ya no caben en el plazo total se
+    entregan con status "skipped" sin renderizarlas.
+    """
+    profile = profile or ocr.get_profile(None)
+    deadline = deadline or time.monotonic() + OCR_REQUEST_DEADLINE_SECONDS
+    dpi = profile.dpi or PDF_DPI
+    for page in range(1, total_pages + 1):
+        attempts = [dpi] + ([OCR_RETRY_DPI] if OCR_RETRY_DPI < dpi else [])
+        entry = None
+        for attempt_dpi in attempts:
+            budget = min(TESSERACT_TIMEOUT_SECONDS, deadline - time.monotonic())
+            if budget < 1:
+                break
+            try:
+                entry = {"page": page, **ocr_page(pdf_path, page, attempt_dpi, budget, layout, profile),
+                         "status": "ok"}
+                if attempt_dpi != dpi:
+                    entry["dpi"] = attempt_dpi
+                break
+            except Exception as e:
+                if not is_timeout_error(e):
+                    raise
+                entry = {"page": page, "text": "", "status": "timeout",
+                         "error": f"Tiempo agotado a {attempt_dpi} DPI: {e}"}
+        if entry is None:
+            entry = {"page": page, "text": "", "status": "skipped",
+                     "error": "Se agotó el tiempo total de la petición."}
+        yield entry
+
+
+def extract_text_from_pdf(
+    pdf_path: str,
+    layout: Optional[str] = None,
+    profile: Optional[OcrProfile] = None,
+    deadline: Optional[float] = None,
+) -> list[dict]:
+    total_pages = check_pdf_pages(pdf_path)
+    return list(iter_ocr_pages(pdf_path, total_pages, layout, profile, deadline))
+
+
+def extract_text_from_pdf_bytes(
+    pdf_bytes: bytes,
+    layout: Optional[str] = None,
+    profile: Optional[OcrProfile] = None,
+    deadline: Optional[float] = None,
+) -> list[dict]:
+    with spool_pdf(pdf_bytes) as pdf:
+        return extract_text_from_pdf(pdf.path, layout, profile, deadline)
+
+
+def validate_document_pdf(
+    pdf_path: str,
+    candidatos: List[dict],
+    umbral: int,
+    profile: Optional[OcrProfile] = None,
+    deadline: Optional[float] = None,
+) -> dict:
+    total_pages = check_pdf_pages(pdf_path)
+    fallidas: List[int] = []
+
+    def paginas():
+        for p in iter_ocr_pages(pdf_path, total_pages, profile=profile, deadline=deadline):
+            if p.get("status", "ok") != "ok":
+                fallidas.append(p["page"])
+            yield p["page"], p["text"]
+
+    resultado = verificar_candidatos_por_pagina(paginas(), candidatos, umbral)
+    return {"total_paginas": total_pages, "paginas_fallidas": fallidas, **resultado}
+
+
+async def run_with_ocr_slot(func, *args):
+    """Ejecuta 'func' en un hilo ocupando un cupo de ocr_semaphore (503 si no hay cupo a tiempo)."""
     try:
         await asyncio.wait_for(
             ocr_semaphore.acquire(),
@@ -71,47 +268,135 @@ async def run_limited_ocr(pdf_bytes: bytes) -> list[dict]:
         )
 
     try:
-        return await asyncio.to_thread(extract_text_from_pdf_bytes, pdf_bytes)
+        return await asyncio.to_thread(func, *args)
     finally:
         ocr_semaphore.release()
 
+
+def ocr_job_key(pdf_sha256: str, layout: Optional[str], profile: OcrProfile) -> str:
+    """Clave de un trabajo OCR: hash del PDF más todo parámetro que cambie el resultado."""
+    params = json.dumps({
+        "layout": layout, "profile": profile.name, "lang": profile.lang, "config": profile.config,
+        "dpi": profile.dpi or PDF_DPI, "retry_dpi": OCR_RETRY_DPI,
+    }, sort_keys=True)
+    return hashlib.sha256(f"{pdf_sha256}:{params}".encode()).hexdigest()
+
+
+async def run_limited_ocr(
+    pdf_path: str,
+    layout: Optional[str] = None,
+    profile: Optional[OcrProfile] = None,
+    deadline: Optional[float] = None,
+) -> list[dict]:
+    return await run_with_ocr_slot(extract_text_from_pdf, pdf_path, layout, profile, deadline)
+
 class TextoLimpiezaRequest(BaseModel):
     texto: str
 
+class PaginaOcr(BaseModel):
+    page: int
+    text: str
+
+class LoteLimpiezaRequest(BaseModel):
+    textos: Optional[List[str]] = None
+    pages: Optional[List[PaginaOcr]] = None  # Respuesta de /convert-pdf tal cual
+
 class VerificacionRequest(BaseModel):
     nombre: str
     documento: str
     texto_evaluar: str  # Se espera texto YA LIMPIO
 
+class Candidato(BaseModel):
+    nombre: str
+    documento: str
+
 # Definición de las Clases para el Merge de PDF
 class PdfJson(BaseModel):
     name: Optional[str] = None
     data_b64: str
     mime_type: Optional[str] = "application/pdf"
+    pages: Optional[str] = None  # Rango de páginas a incluir, ej. "1-3,5". None = todas
 
 class MergeJsonRequest(BaseModel):
     files: List[PdfJson]
+    dedupe_pages: bool = False  # Omite páginas idénticas (portadas repetidas, anexos duplicados)
+    compress: bool = False  # Comprime content streams y unifica imágenes/fuentes idénticas
+    max_image_px: Optional[int] = Field(None, gt=0)  # Reduce imágenes cuyo lado mayor supere este tamaño
+
+class MergeSessionFilesRequest(BaseModel):
+    # dedupe_pages/compress/max_image_px se indican al finalizar; aquí se rechazan (422)
+    # para que no se ignoren en silencio.
+    model_config = ConfigDict(extra="forbid")
+
+    files: List[PdfJson]
+
+class ReorderPagesRequest(BaseModel):
+    pages: List[int]  # Números de página actuales (base 1) en el nuevo orden
 
 @app.get("/")
 async def root():
     return {
         "message": "API de OCR y Limpieza de texto",
         "endpoints": {
-            "POST /convert-pdf": "multipart/form-data 'file': PDF -> texto por página",
+            "POST /convert-pdf": "multipart/form-data 'file': PDF [?layout=columnar|binary&profile=invoice] -> texto por página (+ palabras con cajas)",
+            "GET /ready": "-> 200 cuando el worker terminó el precalentamiento, 503 mientras tanto",
+            "GET /ocr-profiles": "-> perfiles OCR disponibles (idioma, psm, oem, whitelist, dpi)",
             "POST /limpiar-texto": "json {'texto': 'string'} -> texto normalizado",
+            "POST /limpiar-texto/lote": "json {'textos': [...]} o {'pages': [...]} (respuesta de /convert-pdf) -> textos normalizados en orden",
             "POST /verificar-persona": "json {'nombre','documento','texto_evaluar(limpio)'} -> score (80 nombre + 20 doc -20 penalización)",  # <---
-            "POST /merge-pdf": "multipart/form-data 'files': [PDF...] -> PDF fusionado",
-            "POST /merge-pdf-json": "json {'files':[{'name','data_b64','mime_type'}]} -> PDF fusionado"
+            "POST /validar-documento": "multipart/form-data 'file': PDF + 'candidatos': json [{'nombre','documento'}] -> score y página por candidato",
+            "POST /merge-pdf": "multipart/form-data 'files': [PDF...] (+ 'pages', 'dedupe_pages', 'compress', 'max_image_px') -> PDF fusionado",
+            "POST /merge-pdf-json": "json {'files':[{'name','data_b64','mime_type','pages'}], 'dedupe_pages', 'compress', 'max_image_px'} -> PDF fusionado",
+            "POST /merge-sessions": "crea una sesión de fusión incremental -> session_id",
+            "POST /merge-sessions/{id}/files": "multipart/form-data 'files': [PDF...], 'pages' opcional -> agrega al final",
+            "POST /merge-sessions/{id}/files-json": "json {'files':[...]} (base64, 'pages' por archivo) -> agrega al final",
+            "PUT /merge-sessions/{id}/pages": "json {'pages':[3,1,2]} -> reordena/elimina páginas",
+            "POST /merge-sessions/{id}/finalize": "-> PDF fusionado (la sesión se elimina)"
         }
     }
 
-# --- Endpoint 1: Extracción de texto de PDF (sin cambios) ---
+# --- Endpoint 1: Extracción de texto de PDF (OCR por página, perfiles, layout, resultados parciales, single-flight) ---
 @app.post("/convert-pdf")
-async def convert_pdf(file: UploadFile = File(...)):
+async def convert_pdf(
+    file: UploadFile = File(...),
+    layout: Optional[str] = Query(
+        None,
+        description="Incluye palabras con cajas y confianza por página: 'columnar' (arreglos paralelos) o 'binary' (base64)",
+    ),
+    profile: Optional[str] = Query(None, description="Perfil OCR (ver GET /ocr-profiles)"),
+):
+    deadline = time.monotonic() + OCR_REQUEST_DEADLINE_SECONDS
+    if layout is not None and layout not in LAYOUT_FORMATS:
+        raise HTTPException(400, f"layout debe ser uno de {list(LAYOUT_FORMATS)}.")
     try:
-        pdf_bytes = await file.read()
-        ocr_results = await run_limited_ocr(pdf_bytes)
-        return JSONResponse(content={"pages": ocr_results})
+        ocr_profile = await asyncio.to_thread(ocr.get_profile, profile)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    try:
+        with await asyncio.to_thread(spool_pdf, file.file) as pdf:
+            shared = False
+            if OCR_SINGLEFLIGHT and pdf.size:
+                # Un reintento del cliente mientras el OCR original sigue corriendo se une a ese trabajo.
+                ocr_results, shared = await singleflight.run_once(
+                    ocr_job_key(pdf.sha256, layout, ocr_profile),
+                    lambda: run_limited_ocr(pdf.path, layout, ocr_profile, deadline),
+                    timeout=max(0.0, deadline - time.monotonic()),
+                )
+            else:
+                ocr_results = await run_limited_ocr(pdf.path, layout, ocr_profile, deadline)
+        failed = [p for p in ocr_results if p["status"] != "ok"]
+        if ocr_results and len(failed) == len(ocr_results):
+            raise HTTPException(504, "Tiempo agotado: no se pudo procesar ninguna página.")
+        return JSONResponse(
+            content={
+                "pages": ocr_results,
+                "partial": bool(failed),
+                "status": "partial" if failed else "complete",
+            },
+            headers={"X-OCR-Shared": "true" if shared else "false"},
+        )
+    except SingleFlightTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except PdfTooLargeError as e:
         raise HTTPException(status_code=413, detail=str(e))
     except ValueError as e:
@@ -125,6 +410,25 @@ async def convert_pdf(file: UploadFile = File(...)):
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 solo cuando el worker terminó el precalentamiento (OCR_WARMUP=1)."""
+    return JSONResponse(status_code=200 if warmup_state["ready"] else 503, content=warmup_state)
+
+@app.get("/ocr-profiles")
+async def list_ocr_profiles():
+    await asyncio.to_thread(ocr.check_profile_languages)
+    return {
+        "default": ocr.DEFAULT_OCR_PROFILE,
+        "profiles": {
+            name: {
+                "lang": p.lang, "psm": p.psm, "oem": p.oem, "whitelist": p.whitelist,
+                "dpi": p.dpi or PDF_DPI, "disponible": name not in ocr.UNAVAILABLE_PROFILES,
+            }
+            for name, p in ocr.OCR_PROFILES.items()
+        },
+    }
+
 # --- Endpoint 2: Limpieza de texto ---
 @app.post("/limpiar-texto")
 async def endpoint_limpiar_texto(data: TextoLimpiezaRequest):
@@ -134,6 +438,48 @@ async def endpoint_limpiar_texto(data: TextoLimpiezaRequest):
         "longitud": len(texto_limpio)
     }
 
+def get_limpieza_pool() -> ProcessPoolExecutor:
+    global limpieza_pool
+    if limpieza_pool is None:
+        # "spawn": el worker de gunicorn ya tiene hilos y un event loop; no conviene hacer fork.
+        limpieza_pool = ProcessPoolExecutor(
+            max_workers=max(1, LIMPIEZA_POOL_WORKERS),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return limpieza_pool
+
+
+async def limpiar_textos_en_lote(textos: List[str]) -> List[str]:
+    """Lotes chicos se limpian en línea; los grandes se reparten en bloques por el pool de procesos."""
+    if sum(len(t) for t in textos) < LIMPIEZA_POOL_MIN_CHARS:
+        return limpiar_textos(textos)
+    pool, loop = get_limpieza_pool(), asyncio.get_running_loop()
+    n_blocks = max(1, LIMPIEZA_POOL_WORKERS) * 4
+    size = -(-len(textos) // n_blocks)
+    blocks = [textos[i:i + size] for i in range(0, len(textos), size)]
+    results = await asyncio.gather(*(loop.run_in_executor(pool, limpiar_textos, b) for b in blocks))
+    return [t for block in results for t in block]
+
+
+@app.post("/limpiar-texto/lote")
+async def endpoint_limpiar_texto_lote(data: LoteLimpiezaRequest):
+    """
+    Limpia varios textos en una sola petición. Acepta 'textos' (lista de strings)
+    o 'pages' (el resultado de /convert-pdf); devuelve los resultados en el mismo orden.
+    """
+    if (data.textos is None) == (data.pages is None):
+        raise HTTPException(400, "Debe enviar 'textos' o 'pages' (solo uno de los dos).")
+    items = data.textos if data.textos is not None else [p.text for p in data.pages]
+    if len(items) > LIMPIEZA_MAX_TEXTOS:
+        raise HTTPException(413, f"Máximo {LIMPIEZA_MAX_TEXTOS} textos por lote.")
+
+    limpios = await limpiar_textos_en_lote(items)
+    resultados = [{"texto_limpio": t, "longitud": len(t)} for t in limpios]
+    if data.pages is not None:
+        for res, page in zip(resultados, data.pages):
+            res["page"] = page.page
+    return {"resultados": resultados, "total": len(resultados)}
+
 @app.post("/verificar-persona")
 async def endpoint_verificar_persona(payload: VerificacionRequest):
     """
@@ -153,39 +499,138 @@ async def endpoint_verificar_persona(payload: VerificacionRequest):
     except Exception as e:
         raise HTTPException(500, f"Error al verificar persona: {e}")
 
+@app.post("/validar-documento")
+async def validar_documento(
+    file: UploadFile = File(...),
+    candidatos: str = Form(..., description='JSON: [{"nombre": "...", "documento": "..."}]'),
+    umbral: int = Form(60, ge=0, le=100, description="Score con el que un candidato se da por encontrado"),
+    profile: Optional[str] = Form(None, description="Perfil OCR (ver GET /ocr-profiles)"),
+):
+    """
+    OCR + limpieza + verificación en una sola llamada. El OCR avanza página por
+    página y se detiene en cuanto todos los candidatos alcanzan 'umbral'.
+    """
+    deadline = time.monotonic() + OCR_REQUEST_DEADLINE_SECONDS
+    try:
+        lista = TypeAdapter(List[Candidato]).validate_json(candidatos)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    if not lista:
+        raise HTTPException(400, "Debe enviar al menos un candidato.")
+    try:
+        ocr_profile = await asyncio.to_thread(ocr.get_profile, profile)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    try:
+        with await asyncio.to_thread(spool_pdf, file.file) as pdf:
+            resultado = await run_with_ocr_slot(
+                validate_document_pdf, pdf.path, [c.model_dump() for c in lista], umbral, ocr_profile, deadline
+            )
+        return JSONResponse(content=resultado)
+    except PdfTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        if "timeout" in str(e).lower():
+            raise HTTPException(status_code=504, detail=str(e))
+        return JSONResponse(status_code=500, content={"error": str(e)})
+    except HTTPException:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+def check_pdf_uploads(files: List[UploadFile]) -> None:
+    if not files: raise HTTPException(400, "Debe enviar al menos un PDF en 'files'.")
+    for f in files:
+        if f.content_type not in ("application/pdf", "application/octet-stream"):
+            raise HTTPException(400, f"'{f.filename}' no parece ser PDF.")
+
+
+def decode_json_files(files: List[PdfJson]) -> List[bytes]:
+    blobs: List[bytes] = []
+    for item in files:
+        if item.mime_type not in ("application/pdf", "application/octet-stream", None):
+            raise HTTPException(400, f"Tipo no permitido: {item.mime_type}")
+        try:
+            blobs.append(base64.b64decode(item.data_b64))
+        except Exception:
+            raise HTTPException(400, "Uno de los 'data_b64' no es base64 válido.")
+    return blobs
+
+
+async def inspect_or_reject(sources) -> list:
+    """Valida todas las entradas en paralelo; si alguna falla responde 400 con el reporte por archivo."""
+    report, readers = await inspect_pdfs(sources)
+    if not all(entry["ok"] for entry in report):
+        raise HTTPException(400, {"message": "Uno o más PDFs no son válidos.", "files": report})
+    return readers
+
+
 @app.post("/merge-pdf", response_class=StreamingResponse)
-async def merge_pdf(files: List[UploadFile] = File(..., description="Uno o más PDFs")):
+async def merge_pdf(
+    files: List[UploadFile] = File(..., description="Uno o más PDFs"),
+    pages: Optional[List[str]] = Form(None, description="Rango de páginas por archivo, en el mismo orden ('' = todas)"),
+    dedupe_pages: bool = Form(False),
+    compress: bool = Form(False),
+    max_image_px: Optional[int] = Form(None, gt=0),
+):
     try:
-        if not files: raise HTTPException(400, "Debe enviar al menos un PDF en 'files'.")
-        for f in files:
-            if f.content_type not in ("application/pdf", "application/octet-stream"):
-                raise HTTPException(400, f"'{f.filename}' no parece ser PDF.")
-        merged_bytes, total_pages = await merge_pdfs_from_uploadfiles(files)
+        check_pdf_uploads(files)
+        # Se leen directamente los archivos temporales del multipart, sin copiarlos a bytes.
+        readers = await inspect_or_reject([(f.filename, f.file, None) for f in files])
+        merged_bytes, total_pages = await asyncio.to_thread(
+            merge_pdf_readers, readers, page_ranges=pages, dedupe_pages=dedupe_pages,
+            compress=compress, max_image_px=max_image_px,
+        )
         headers = {"Content-Disposition": 'attachment; filename="merged.pdf"',
                    "X-Merged-Pages": str(total_pages)}
         return StreamingResponse(BytesIO(merged_bytes), media_type="application/pdf", headers=headers)
     except PdfMergeError as e:
         raise HTTPException(400, str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Error interno al fusionar PDFs: {e}")
 
 
-@app.post("/merge-pdf-json", response_class=StreamingResponse)
-async def merge_pdf_json(req: MergeJsonRequest):
+@app.post(
+    "/merge-pdf-json",
+    response_class=StreamingResponse,
+    openapi_extra={"requestBody": {"required": True, "content": {"application/json": {
+        "schema": {"$ref": "#/components/schemas/MergeJsonRequest"}}}}},
+)
+async def merge_pdf_json(request: Request):
+    # El cuerpo se procesa en streaming: cada data_b64 se decodifica por bloques a un
+    # archivo temporal en lugar de cargar el JSON completo en memoria (ver app/ingest.py).
+    parser = MergeJsonStreamParser()
     try:
+        try:
+            async for chunk in request.stream():
+                parser.feed(chunk)
+            body, spools = parser.close()
+        except JsonStreamError as e:
+            raise HTTPException(400, f"JSON inválido: {e}")
+        try:
+            req = MergeJsonRequest.model_validate(body)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
         if not req.files:
             raise HTTPException(400, "Debe enviar al menos un archivo en 'files'.")
-
-        blobs: List[bytes] = []
         for item in req.files:
             if item.mime_type not in ("application/pdf", "application/octet-stream", None):
                 raise HTTPException(400, f"Tipo no permitido: {item.mime_type}")
-            try:
-                blobs.append(base64.b64decode(item.data_b64))
-            except Exception:
-                raise HTTPException(400, "Uno de los 'data_b64' no es base64 válido.")
 
-        merged_bytes, total_pages = merge_pdfs_from_bytes(blobs)
+        by_index = {spool.index: spool for spool in spools}
+        readers = await inspect_or_reject([
+            (item.name, by_index[i].file if i in by_index else None, by_index[i].error if i in by_index else None)
+            for i, item in enumerate(req.files)
+        ])
+        merged_bytes, total_pages = await asyncio.to_thread(
+            merge_pdf_readers, readers,
+            page_ranges=[item.pages for item in req.files],
+            dedupe_pages=req.dedupe_pages, compress=req.compress, max_image_px=req.max_image_px,
+        )
 
         headers = {
             "Content-Disposition": 'attachment; filename="merged_from_json.pdf"',
@@ -194,32 +639,124 @@ async def merge_pdf_json(req: MergeJsonRequest):
         return StreamingResponse(BytesIO(merged_bytes), media_type="application/pdf", headers=headers)
     except PdfMergeError as e:
         raise HTTPException(400, str(e))
-    except HTTPException:
+    except (HTTPException, RequestValidationError):
         raise
     except Exception as e:
         raise HTTPException(500, f"Error interno al fusionar PDFs (JSON): {e}")
+    finally:
+        # parser.spools también tiene los archivos ya creados si el JSON falló a mitad de camino.
+        for spool in parser.spools.values():
+            spool.file.close()
+
+# --- Sesiones de fusión incremental ---
+@app.post("/merge-sessions")
+async def create_merge_session():
+    return await asyncio.to_thread(merge_sessions.create_session)
+
+
+@app.get("/merge-sessions/{session_id}")
+async def get_merge_session(session_id: str):
+    try:
+        return await asyncio.to_thread(merge_sessions.get_session, session_id)
+    except MergeSessionNotFound as e:
+        raise HTTPException(404, str(e))
+
+
+@app.post("/merge-sessions/{session_id}/files")
+async def append_merge_session_files(
+    session_id: str,
+    files: List[UploadFile] = File(..., description="Uno o más PDFs"),
+    pages: Optional[List[str]] = Form(None, description="Rango de páginas por archivo, en el mismo orden ('' = todas)"),
+):
+    try:
+        check_pdf_uploads(files)
+        blobs = [await f.read() for f in files]
+        return await asyncio.to_thread(merge_sessions.append_pdfs, session_id, blobs, pages)
+    except MergeSessionNotFound as e:
+        raise HTTPException(404, str(e))
+    except MergeSessionFinalized as e:
+        raise HTTPException(409, str(e))
+    except PdfMergeError as e:
+        raise HTTPException(400, str(e))
+
+
+@app.post("/merge-sessions/{session_id}/files-json")
+async def append_merge_session_files_json(session_id: str, req: MergeSessionFilesRequest):
+    try:
+        if not req.files:
+            raise HTTPException(400, "Debe enviar al menos un archivo en 'files'.")
+        blobs = decode_json_files(req.files)
+        return await asyncio.to_thread(
+            merge_sessions.append_pdfs, session_id, blobs, [item.pages for item in req.files]
+        )
+    except MergeSessionNotFound as e:
+        raise HTTPException(404, str(e))
+    except MergeSessionFinalized as e:
+        raise HTTPException(409, str(e))
+    except PdfMergeError as e:
+        raise HTTPException(400, str(e))
+
+
+@app.put("/merge-sessions/{session_id}/pages")
+async def reorder_merge_session_pages(session_id: str, req: ReorderPagesRequest):
+    try:
+        return await asyncio.to_thread(merge_sessions.reorder_pages, session_id, req.pages)
+    except MergeSessionNotFound as e:
+        raise HTTPException(404, str(e))
+    except MergeSessionFinalized as e:
+        raise HTTPException(409, str(e))
+    except PdfMergeError as e:
+        raise HTTPException(400, str(e))
+
+
+@app.post("/merge-sessions/{session_id}/finalize", response_class=FileResponse)
+async def finalize_merge_session(
+    session_id: str,
+    dedupe_pages: bool = Query(False),
+    compress: bool = Query(False),
+    max_image_px: Optional[int] = Query(None, gt=0),
+):
+    try:
+        out_path, total_pages = await asyncio.to_thread(
+            merge_sessions.finalize_session, session_id,
+            dedupe_pages=dedupe_pages, compress=compress, max_image_px=max_image_px,
+        )
+    except MergeSessionNotFound as e:
+        raise HTTPException(404, str(e))
+    except MergeSessionFinalized as e:
+        raise HTTPException(409, str(e))
+    except PdfMergeError as e:
+        raise HTTPException(400, str(e))
+    except Exception as e:
+        raise HTTPException(500, f"Error interno al finalizar la sesión: {e}")
+    return FileResponse(
+        out_path,
+        media_type="application/pdf",
+        filename="merged.pdf",
+        headers={"X-Merged-Pages": str(total_pages)},
+        background=BackgroundTask(merge_sessions.delete_session, session_id),
+    )
+
+
+@app.delete("/merge-sessions/{session_id}")
+async def delete_merge_session(session_id: str):
+    try:
+        await asyncio.to_thread(merge_sessions.delete_session, session_id)
+    except MergeSessionNotFound as e:
+        raise HTTPException(404, str(e))
+    return {"session_id": session_id, "deleted": True}
 
 @app.post("/pdf-to-images")
 async def pdf_to_images(file: UploadFile = File(...)):
     try:
-        pdf_bytes = await file.read()
-        
-        # Convertimos el PDF a imágenes (una por página)
-        # Usamos 200 DPI para que el texto pequeño sea legible pero no pese demasiado
-        images = convert_from_bytes(pdf_bytes, dpi=200)
-        
-        base64_images = []
-
-        for img in images:
-            buffered = BytesIO()
-            # Guardamos como JPEG para reducir el peso del envío (calidad 85-90 es suficiente)
-            img.save(buffered, format="JPEG", quality=85)
-            
-            # Convertimos a base64
-            img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-            
-            # Formateamos como Data URI para que sea fácil de usar en n8n o LLM
-            base64_images.append(f"data:image/jpeg;base64,{img_str}")
+        with await asyncio.to_thread(spool_pdf, file.file) as pdf:
+            # Convertimos el PDF a imágenes (una por página)
+            # Usamos 200 DPI para que el texto pequeño sea legible pero no pese demasiado
+            # Poppler escribe directamente JPEG (calidad 85-90 es suficiente para el envío)
+            images = await asyncio.to_thread(render.render_pages_jpeg_b64, pdf.path, 200, 85)
+
+        # Formateamos como Data URI para que sea fácil de usar en n8n o LLM
+        base64_images = [f"data:image/jpeg;base64,{img_str}" for img_str in images]
 
         return JSONResponse(content={
             "filename": file.filename,
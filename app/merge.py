@@ -1,26 +1,200 @@
+import hashlib
 from io import BytesIO
-from typing import Iterable, Tuple
-from pypdf import PdfReader, PdfWriter
+from typing import TYPE_CHECKING, BinaryIO, Iterable, List, Optional, Sequence, Tuple, Union
+
+# pypdf se importa dentro de las funciones para no cargarlo al arrancar cada worker.
+if TYPE_CHECKING:
+    from pypdf import PageObject, PdfReader, PdfWriter
 
 class PdfMergeError(Exception): pass
 
-def merge_pdfs_from_bytes(pdf_blobs: Iterable[bytes]) -> Tuple[bytes, int]:
-    writer, total = PdfWriter(), 0
-    any_input = False
-    for blob in pdf_blobs:
-        any_input = True
-        if not blob: raise PdfMergeError("Se recibió un PDF vacío.")
-        r = PdfReader(BytesIO(blob))
-        if getattr(r, "is_encrypted", False):
-            try: r.decrypt("")
-            except Exception: raise PdfMergeError("PDF protegido con contraseña.")
-        for page in r.pages:
-            writer.add_page(page); total += 1
-    if not any_input or total == 0:
+def read_pdf(src: Union[bytes, BinaryIO]) -> "PdfReader":
+    """Abre un PDF (bytes o archivo binario); falla con PdfMergeError si está vacío o protegido."""
+    from pypdf import PdfReader
+    if isinstance(src, (bytes, bytearray)):
+        stream = BytesIO(src)
+    else:
+        stream = src; stream.seek(0)
+    if not stream.read(1): raise PdfMergeError("Se recibió un PDF vacío.")
+    stream.seek(0)
+    try:
+        r = PdfReader(stream)
+    except Exception as e:
+        raise PdfMergeError(f"PDF inválido: {e}")
+    if getattr(r, "is_encrypted", False):
+        try: r.decrypt("")
+        except Exception: raise PdfMergeError("PDF protegido con contraseña.")
+    return r
+
+def parse_page_ranges(spec: Optional[str], total: int) -> List[int]:
+    """
+    Convierte un rango tipo "1-3,5,8-" en índices de página base 0.
+    Vacío o None selecciona todas las páginas. Respeta el orden indicado.
+    """
+    if not spec or not spec.strip():
+        return list(range(total))
+    indices: List[int] = []
+    for part in spec.split(","):
+        part = part.strip()
+        try:
+            if "-" in part:
+                start_s, end_s = part.split("-", 1)
+                start = int(start_s) if start_s.strip() else 1
+                end = int(end_s) if end_s.strip() else total
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise PdfMergeError(f"Rango de páginas inválido: '{spec}'.")
+        if not 1 <= start <= end <= total:
+            raise PdfMergeError(f"Rango '{part}' fuera de límites; el PDF tiene {total} páginas.")
+        indices.extend(range(start - 1, end))
+    return indices
+
+def _hash_pdf_object(h: "hashlib._Hash", obj, seen: set) -> None:
+    """
+    Agrega al hash un objeto PDF de forma recursiva: diccionarios (claves ordenadas),
+    arreglos y streams (datos decodificados). Cubre recursos anidados, como
+    imágenes dentro de Form XObjects, fuentes, /ExtGState o apariencias (/AP).
+    """
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+    if isinstance(obj, IndirectObject):
+        ref = (id(obj.pdf), obj.idnum, obj.generation)
+        if ref in seen:
+            h.update(b"<ref>")
+            return
+        seen.add(ref)
+        obj = obj.get_object()
+    if isinstance(obj, DictionaryObject):
+        h.update(b"<<")
+        for key in sorted(obj.keys()):
+            # /Parent apunta hacia arriba (árbol de páginas/campos); /Length depende de la compresión.
+            if key in ("/Parent", "/Length"):
+                continue
+            h.update(key.encode())
+            _hash_pdf_object(h, obj.raw_get(key), seen)
+        if isinstance(obj, StreamObject):
+            h.update(obj.get_data())
+        h.update(b">>")
+    elif isinstance(obj, ArrayObject):
+        h.update(b"[")
+        for item in obj:
+            _hash_pdf_object(h, item, seen)
+        h.update(b"]")
+    else:
+        h.update(repr(obj).encode())
+
+def page_fingerprint(page: "PageObject") -> str:
+    """
+    Hash del contenido visible de la página: tamaño, rotación, content stream,
+    todo el árbol de /Resources (XObjects anidados, fuentes, /ExtGState...) y
+    anotaciones (valores de campos y su apariencia).
+    """
+    h = hashlib.sha256(repr([float(v) for v in page.mediabox]).encode())
+    h.update(f"rotate:{page.get('/Rotate', 0)}".encode())
+    contents = page.get_contents()
+    if contents is not None:
+        h.update(contents.get_data())
+    seen: set = set()
+    if "/Resources" in page:
+        _hash_pdf_object(h, page.raw_get("/Resources"), seen)
+    annots = page.get("/Annots")
+    for annot in (annots.get_object() if annots is not None else []):
+        annot = annot.get_object()
+        h.update(b"annot")
+        for key in ("/Subtype", "/Rect", "/T", "/Contents"):
+            h.update(repr(annot.get(key)).encode())
+        # El valor de un campo puede estar en el widget o en su campo padre.
+        field, value = annot, annot.get("/V")
+        while value is None and "/Parent" in field:
+            field = field["/Parent"].get_object()
+            value = field.get("/V")
+        h.update(repr(value.get_object() if value is not None else None).encode())
+        if "/AP" in annot:
+            _hash_pdf_object(h, annot.raw_get("/AP"), seen)
+    return h.hexdigest()
+
+def _is_gray_palette(pil) -> bool:
+    palette = pil.getpalette() or []
+    return all(palette[i] == palette[i + 1] == palette[i + 2] for i in range(0, len(palette) - 2, 3))
+
+def _encoded_size(obj) -> int:
+    """Bytes que ocupa el objeto (diccionario + stream comprimido) al escribirse en el PDF."""
+    out = BytesIO(); obj.write_to_stream(out)
+    return out.tell()
+
+def _downsample_images(writer: "PdfWriter", max_image_px: int) -> None:
+    """Reduce y recodifica como JPEG q80 las imágenes grandes; conserva la original si la nueva no pesa menos."""
+    for page in writer.pages:
+        for img in page.images:
+            try:
+                pil = img.image
+                if pil is None or max(pil.size) <= max_image_px: continue
+                old_len = _encoded_size(img.indirect_reference.get_object()) if img.indirect_reference else 0
+                pil = pil.copy(); pil.thumbnail((max_image_px, max_image_px))
+                # Escaneos bitonales, grises con alfa o paleta gris: JPEG en gris, no RGB (triplica el peso).
+                if pil.mode in ("1", "LA", "I", "I;16") or (pil.mode == "P" and _is_gray_palette(pil)):
+                    pil = pil.convert("L")
+                elif pil.mode not in ("RGB", "L"):
+                    pil = pil.convert("RGB")
+                encoded = BytesIO(); pil.save(encoded, "JPEG", quality=80)
+                if old_len and encoded.tell() >= old_len: continue
+                img.replace(pil, quality=80)
+            except Exception:
+                # Imágenes con máscaras o espacios de color exóticos se dejan intactas.
+                continue
+
+def write_merged_pdf(
+    pages: Iterable["PageObject"],
+    out: BinaryIO,
+    dedupe_pages: bool = False,
+    compress: bool = False,
+    max_image_px: Optional[int] = None,
+) -> int:
+    """
+    Escribe las páginas en 'out' y devuelve el total escrito.
+    - dedupe_pages: omite páginas idénticas a una ya agregada (mismo page_fingerprint).
+    - compress: comprime content streams y unifica objetos idénticos (imágenes, fuentes) entre entradas.
+    - max_image_px: reduce imágenes cuyo lado mayor supere ese tamaño en píxeles.
+    """
+    from pypdf import PdfWriter
+    writer, total, seen = PdfWriter(), 0, set()
+    for page in pages:
+        if dedupe_pages:
+            fp = page_fingerprint(page)
+            if fp in seen: continue
+            seen.add(fp)
+        writer.add_page(page); total += 1
+    if total == 0:
         raise PdfMergeError("No se encontraron páginas válidas.")
-    out = BytesIO(); writer.write(out); writer.close(); out.seek(0)
-    return out.read(), total
+    if max_image_px:
+        _downsample_images(writer, max_image_px)
+    if compress:
+        for page in writer.pages:
+            page.compress_content_streams()
+        writer.compress_identical_objects()
+    writer.write(out); writer.close()
+    return total
+
+def merge_pdf_readers(
+    readers: Iterable["PdfReader"],
+    page_ranges: Optional[Sequence[Optional[str]]] = None,
+    dedupe_pages: bool = False,
+    compress: bool = False,
+    max_image_px: Optional[int] = None,
+) -> Tuple[bytes, int]:
+    """page_ranges: un rango por entrada (ver parse_page_ranges); None usa todas las páginas."""
+    def selected_pages():
+        for i, r in enumerate(readers):
+            spec = page_ranges[i] if page_ranges and i < len(page_ranges) else None
+            for idx in parse_page_ranges(spec, len(r.pages)):
+                yield r.pages[idx]
+    out = BytesIO()
+    total = write_merged_pdf(selected_pages(), out, dedupe_pages, compress, max_image_px)
+    return out.getvalue(), total
+
+def merge_pdfs_from_bytes(pdf_blobs: Iterable[Union[bytes, BinaryIO]], **options) -> Tuple[bytes, int]:
+    return merge_pdf_readers((read_pdf(blob) for blob in pdf_blobs), **options)
 
-async def merge_pdfs_from_uploadfiles(files) -> Tuple[bytes, int]:
+async def merge_pdfs_from_uploadfiles(files, **options) -> Tuple[bytes, int]:
     blobs = [await f.read() for f in files]
-    return merge_pdfs_from_bytes(blobs)
+    return merge_pdfs_from_bytes(blobs, **options)
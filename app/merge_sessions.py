@@ -0,0 +1,251 @@
+"""
+Sesiones de fusión incremental de PDFs.
+
+Una sesión guarda en disco local cada documento agregado (una sola vez) y un
+manifiesto JSON con el orden de páginas. Agregar un documento solo analiza
+ese documento; el PDF final se construye una única vez al finalizar, por lo
+que armar un paquete de N páginas cuesta O(N) en lugar de re-fusionar todo
+el documento acumulado en cada llamada.
+
+Estructura en disco:
+    <MERGE_SESSION_DIR>/<session_id>/manifest.json
+    <MERGE_SESSION_DIR>/<session_id>/part_0001.pdf, part_0002.pdf, ...
+    <MERGE_SESSION_DIR>/<session_id>/.lock
+
+Los workers de gunicorn comparten MERGE_SESSION_DIR, así que cada operación
+que lee y reescribe el manifiesto toma un flock sobre el .lock de la sesión.
+"""
+
+import fcntl
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .merge import PdfMergeError, parse_page_ranges, read_pdf, write_merged_pdf
+
+MERGE_SESSION_DIR = os.getenv(
+    "MERGE_SESSION_DIR", os.path.join(tempfile.gettempdir(), "pdf2image-merge-sessions")
+)
+MERGE_SESSION_TTL_SECONDS = int(os.getenv("MERGE_SESSION_TTL_SECONDS", "3600"))
+
+_SESSION_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_MANIFEST = "manifest.json"
+_LOCK = ".lock"
+
+
+class MergeSessionNotFound(Exception):
+    pass
+
+
+class MergeSessionFinalized(Exception):
+    """La sesión ya se finalizó: no admite más cambios ni otra finalización."""
+    pass
+
+
+def _session_dir(session_id: str) -> str:
+    if not _SESSION_ID_RE.match(session_id or ""):
+        raise MergeSessionNotFound(f"Sesión no encontrada: {session_id}")
+    return os.path.join(MERGE_SESSION_DIR, session_id)
+
+
+def _read_manifest(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, _MANIFEST), "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _write_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    manifest["updated"] = time.time()
+    fd, tmp = tempfile.mkstemp(dir=path, prefix=_MANIFEST, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh)
+        os.replace(tmp, os.path.join(path, _MANIFEST))
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+@contextmanager
+def _session_lock(session_id: str) -> Iterator[None]:
+    """Bloqueo exclusivo de la sesión entre hilos y procesos (flock; se libera si el proceso muere)."""
+    try:
+        fd = os.open(os.path.join(_session_dir(session_id), _LOCK), os.O_RDWR | os.O_CREAT)
+    except (FileNotFoundError, NotADirectoryError):
+        raise MergeSessionNotFound(f"Sesión no encontrada: {session_id}")
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _is_expired(manifest: Dict[str, Any], now: Optional[float] = None) -> bool:
+    now = time.time() if now is None else now
+    return now - manifest.get("updated", 0) > MERGE_SESSION_TTL_SECONDS
+
+
+def _load(session_id: str, writable: bool = False) -> Tuple[str, Dict[str, Any]]:
+    path = _session_dir(session_id)
+    try:
+        manifest = _read_manifest(path)
+    except (FileNotFoundError, ValueError):
+        raise MergeSessionNotFound(f"Sesión no encontrada: {session_id}")
+    if _is_expired(manifest):
+        shutil.rmtree(path, ignore_errors=True)
+        raise MergeSessionNotFound(f"La sesión {session_id} expiró.")
+    if writable and manifest.get("finalized"):
+        raise MergeSessionFinalized(f"La sesión {session_id} ya fue finalizada.")
+    return path, manifest
+
+
+def _summary(session_id: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "session_id": session_id,
+        "files": len(manifest["parts"]),
+        "total_pages": len(manifest["pages"]),
+        "finalized": bool(manifest.get("finalized")),
+        "expires_in": max(0, int(manifest["updated"] + MERGE_SESSION_TTL_SECONDS - time.time())),
+    }
+
+
+def purge_expired_sessions() -> int:
+    """Elimina del disco las sesiones vencidas. Devuelve cuántas se borraron."""
+    if not os.path.isdir(MERGE_SESSION_DIR):
+        return 0
+    removed, now = 0, time.time()
+    for name in os.listdir(MERGE_SESSION_DIR):
+        path = os.path.join(MERGE_SESSION_DIR, name)
+        try:
+            expired = _is_expired(_read_manifest(path), now)
+        except (FileNotFoundError, NotADirectoryError, ValueError):
+            # Sesión a medio crear o corrupta: se usa la fecha del directorio.
+            try:
+                expired = now - os.path.getmtime(path) > MERGE_SESSION_TTL_SECONDS
+            except OSError:
+                continue
+        if expired:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def create_session() -> Dict[str, Any]:
+    purge_expired_sessions()
+    session_id = uuid.uuid4().hex
+    path = os.path.join(MERGE_SESSION_DIR, session_id)
+    os.makedirs(path)
+    manifest = {"created": time.time(), "parts": [], "pages": []}
+    _write_manifest(path, manifest)
+    return _summary(session_id, manifest)
+
+
+def get_session(session_id: str) -> Dict[str, Any]:
+    _, manifest = _load(session_id)
+    return _summary(session_id, manifest)
+
+
+def append_pdfs(
+    session_id: str,
+    pdf_blobs: List[bytes],
+    page_ranges: Optional[List[Optional[str]]] = None,
+) -> Dict[str, Any]:
+    """
+    Agrega uno o más PDFs al final de la sesión.
+
+    Solo se analizan los documentos nuevos; los ya agregados no se vuelven a leer.
+    'page_ranges' permite incluir solo parte de cada documento (ver parse_page_ranges).
+    Si alguno es inválido no se agrega ninguno.
+    """
+    if not pdf_blobs:
+        raise PdfMergeError("Debe enviar al menos un PDF.")
+    selections = []
+    for i, blob in enumerate(pdf_blobs):
+        spec = page_ranges[i] if page_ranges and i < len(page_ranges) else None
+        selections.append(parse_page_ranges(spec, len(read_pdf(blob).pages)))
+    if any(not sel for sel in selections):
+        raise PdfMergeError("No se encontraron páginas válidas.")
+
+    with _session_lock(session_id):
+        path, manifest = _load(session_id, writable=True)
+        for blob, selected in zip(pdf_blobs, selections):
+            part_idx = len(manifest["parts"])
+            part_name = f"part_{part_idx + 1:04d}.pdf"
+            with open(os.path.join(path, part_name), "wb") as fh:
+                fh.write(blob)
+            manifest["parts"].append(part_name)
+            manifest["pages"].extend([part_idx, i] for i in selected)
+        _write_manifest(path, manifest)
+    return _summary(session_id, manifest)
+
+
+def reorder_pages(session_id: str, pages: List[int]) -> Dict[str, Any]:
+    """
+    Reordena las páginas actuales de la sesión.
+
+    'pages' lista números de página actuales (base 1) en el nuevo orden;
+    las páginas omitidas se eliminan del resultado.
+    """
+    if not pages:
+        raise PdfMergeError("La sesión debe conservar al menos una página.")
+    with _session_lock(session_id):
+        path, manifest = _load(session_id, writable=True)
+        current = manifest["pages"]
+        invalid = [p for p in pages if not 1 <= p <= len(current)]
+        if invalid:
+            raise PdfMergeError(
+                f"Páginas fuera de rango: {invalid}; la sesión tiene {len(current)} páginas."
+            )
+        manifest["pages"] = [current[p - 1] for p in pages]
+        _write_manifest(path, manifest)
+    return _summary(session_id, manifest)
+
+
+def finalize_session(session_id: str, **options) -> Tuple[str, int]:
+    """
+    Construye el PDF final de la sesión y devuelve (ruta, total_paginas).
+
+    'options' se pasan a write_merged_pdf (dedupe_pages, compress, max_image_px).
+    El archivo (nombre único) queda dentro del directorio de la sesión; quien
+    lo sirva debe llamar a delete_session al terminar. La sesión queda marcada
+    como finalizada: agregar, reordenar o volver a finalizar lanza
+    MergeSessionFinalized, así un reintento no pisa el PDF que se está enviando
+    ni se aceptan archivos que no llegarían al resultado.
+    """
+    readers: Dict[int, Any] = {}
+
+    def session_pages():
+        for part_idx, page_idx in manifest["pages"]:
+            if part_idx not in readers:
+                with open(os.path.join(path, manifest["parts"][part_idx]), "rb") as fh:
+                    readers[part_idx] = read_pdf(fh.read())
+            yield readers[part_idx].pages[page_idx]
+
+    with _session_lock(session_id):
+        path, manifest = _load(session_id, writable=True)
+        fd, out_path = tempfile.mkstemp(dir=path, prefix="merged_", suffix=".pdf")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                total = write_merged_pdf(session_pages(), fh, **options)
+        except BaseException:
+            os.remove(out_path)
+            raise
+        manifest["finalized"] = True
+        _write_manifest(path, manifest)
+    return out_path, total
+
+
+def delete_session(session_id: str) -> None:
+    with _session_lock(session_id):
+        path = _session_dir(session_id)
+        if not os.path.isdir(path):
+            raise MergeSessionNotFound(f"Sesión no encontrada: {session_id}")
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,216 @@
+"""
+Utilidades de OCR sobre imágenes de página (pytesseract).
+
+Cuando se piden las cajas de palabras se usa una sola pasada de Tesseract
+(image_to_data) y el texto de la página se reconstruye a partir de esas
+mismas palabras, en lugar de llamar además a image_to_string.
+
+Los perfiles de OCR (idioma, PSM, OEM, lista blanca de caracteres y DPI) se
+definen aquí, se validan al importar el módulo y su cadena de configuración
+de Tesseract se arma una sola vez.
+"""
+
+import base64
+import json
+import logging
+import os
+import sys
+import threading
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class OcrProfile:
+    """
+    Parámetros de Tesseract para un tipo de documento.
+    - lang: idiomas de Tesseract ("spa", "spa+eng"); None usa el idioma por defecto.
+    - psm/oem: page segmentation mode (0-13) y OCR engine mode (0-3).
+    - whitelist: caracteres permitidos (tessedit_char_whitelist).
+    - dpi: resolución de render del PDF; None usa PDF_DPI.
+    """
+    name: str
+    lang: Optional[str] = None
+    psm: Optional[int] = None
+    oem: Optional[int] = None
+    whitelist: Optional[str] = None
+    dpi: Optional[int] = None
+    config: str = field(init=False, default="")
+
+    def __post_init__(self):
+        if self.psm is not None and not 0 <= self.psm <= 13:
+            raise ValueError(f"Perfil OCR '{self.name}': psm debe estar entre 0 y 13.")
+        if self.oem is not None and not 0 <= self.oem <= 3:
+            raise ValueError(f"Perfil OCR '{self.name}': oem debe estar entre 0 y 3.")
+        if self.dpi is not None and not 50 <= self.dpi <= 600:
+            raise ValueError(f"Perfil OCR '{self.name}': dpi debe estar entre 50 y 600.")
+        if self.whitelist is not None and (not self.whitelist or any(c.isspace() for c in self.whitelist)):
+            raise ValueError(f"Perfil OCR '{self.name}': whitelist no puede estar vacía ni tener espacios.")
+        parts = []
+        if self.psm is not None: parts.append(f"--psm {self.psm}")
+        if self.oem is not None: parts.append(f"--oem {self.oem}")
+        if self.whitelist: parts.append(f"-c tessedit_char_whitelist={self.whitelist}")
+        object.__setattr__(self, "config", " ".join(parts))
+
+
+def _load_profiles() -> Dict[str, OcrProfile]:
+    profiles = {
+        # Comportamiento histórico: idioma y segmentación por defecto de Tesseract.
+        "default": OcrProfile("default"),
+        # Facturas con tablas (CUPS, valores): un bloque uniforme de texto en español.
+        "invoice": OcrProfile("invoice", lang="spa", psm=6, oem=1),
+        # Documentos de identidad: texto disperso en distintas zonas de la página.
+        "id-document": OcrProfile("id-document", lang="spa", psm=11, oem=1, dpi=200),
+        # Recortes o páginas con una sola línea de texto.
+        "single-line": OcrProfile("single-line", lang="spa", psm=7, oem=1),
+        # Números de documento, valores y fechas.
+        "digits": OcrProfile("digits", psm=7, oem=1, whitelist="0123456789.,-/"),
+    }
+    # OCR_PROFILES_JSON='{"nombre": {"lang": "spa", "psm": 4}}' agrega o reemplaza perfiles.
+    extra = os.getenv("OCR_PROFILES_JSON")
+    if extra:
+        for name, params in json.loads(extra).items():
+            profiles[name] = OcrProfile(name, **params)
+    return profiles
+
+
+OCR_PROFILES = _load_profiles()
+DEFAULT_OCR_PROFILE = os.getenv("OCR_DEFAULT_PROFILE", "default")
+if DEFAULT_OCR_PROFILE not in OCR_PROFILES:
+    raise ValueError(f"OCR_DEFAULT_PROFILE '{DEFAULT_OCR_PROFILE}' no es un perfil definido.")
+
+# Perfiles cuyo idioma no está instalado en Tesseract (se llena en check_profile_languages).
+UNAVAILABLE_PROFILES: Dict[str, str] = {}
+_languages_checked = False
+_languages_lock = threading.Lock()
+
+
+def check_profile_languages() -> None:
+    """
+    Verifica una sola vez por worker que los idiomas de cada perfil estén instalados
+    en Tesseract. Se ejecuta en el precalentamiento o, si no lo hay, con el primer
+    get_profile, para no importar pytesseract ni lanzar tesseract al arrancar.
+    """
+    global _languages_checked
+    with _languages_lock:
+        if _languages_checked:
+            return
+        _languages_checked = True
+        import pytesseract
+        try:
+            installed = set(pytesseract.get_languages(config=""))
+        except Exception as e:
+            logger.warning("No se pudo consultar los idiomas de Tesseract: %s", e)
+            return
+        for profile in OCR_PROFILES.values():
+            missing = [l for l in (profile.lang or "").split("+") if l and l not in installed]
+            if missing:
+                UNAVAILABLE_PROFILES[profile.name] = f"Idioma(s) de Tesseract no instalado(s): {', '.join(missing)}."
+                logger.warning("Perfil OCR '%s' deshabilitado: %s", profile.name, UNAVAILABLE_PROFILES[profile.name])
+
+
+def get_profile(name: Optional[str]) -> OcrProfile:
+    """Devuelve el perfil pedido (o el por defecto); ValueError si no existe o no está disponible."""
+    name = name or DEFAULT_OCR_PROFILE
+    check_profile_languages()
+    if name not in OCR_PROFILES:
+        raise ValueError(f"Perfil OCR desconocido '{name}'. Disponibles: {sorted(OCR_PROFILES)}.")
+    if name in UNAVAILABLE_PROFILES:
+        raise ValueError(f"Perfil OCR '{name}' no disponible: {UNAVAILABLE_PROFILES[name]}")
+    return OCR_PROFILES[name]
+
+# Formatos de salida de las cajas de palabras para /convert-pdf?layout=...
+LAYOUT_FORMATS = ("columnar", "binary")
+
+# Columnas numéricas del formato binario, en el orden en que se concatenan.
+# Todas son uint16 little-endian salvo 'conf' (int8, -1 = sin confianza).
+BINARY_FIELDS = ("left", "top", "width", "height", "block", "par", "line", "conf")
+
+
+def words_from_data(data: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+    """
+    Convierte la salida de image_to_data (Output.DICT) en arreglos paralelos,
+    solo con las palabras reconocidas (nivel 5, texto no vacío).
+    """
+    cols: Dict[str, List[Any]] = {k: [] for k in ("text",) + BINARY_FIELDS}
+    for i, text in enumerate(data.get("text", [])):
+        text = str(text).strip()
+        if data["level"][i] != 5 or not text:
+            continue
+        cols["text"].append(text)
+        cols["left"].append(int(data["left"][i]))
+        cols["top"].append(int(data["top"][i]))
+        cols["width"].append(int(data["width"][i]))
+        cols["height"].append(int(data["height"][i]))
+        cols["block"].append(int(data["block_num"][i]))
+        cols["par"].append(int(data["par_num"][i]))
+        cols["line"].append(int(data["line_num"][i]))
+        cols["conf"].append(int(float(data["conf"][i])))
+    return cols
+
+
+def text_from_words(words: Dict[str, List[Any]]) -> str:
+    """Reconstruye el texto: palabras de una línea con espacio, líneas con salto y párrafos con línea en blanco."""
+    out: List[str] = []
+    prev_par = prev_line = None
+    for text, block, par, line in zip(words["text"], words["block"], words["par"], words["line"]):
+        if prev_par is None:
+            pass
+        elif (block, par) != prev_par:
+            out.append("\n\n")
+        elif line != prev_line:
+            out.append("\n")
+        else:
+            out.append(" ")
+        out.append(text)
+        prev_par, prev_line = (block, par), line
+    return "".join(out)
+
+
+def encode_words(words: Dict[str, List[Any]], fmt: str = "columnar") -> Dict[str, Any]:
+    """
+    'columnar': arreglos JSON paralelos (text, left, top, width, height, block, par, line, conf).
+    'binary': 'text' como lista y el resto concatenado en 'data_b64' según BINARY_FIELDS.
+    """
+    count = len(words["text"])
+    if fmt == "columnar":
+        return {"format": "columnar", "count": count, **words}
+    if fmt != "binary":
+        raise ValueError(f"Formato de layout no soportado: {fmt}")
+
+    raw = bytearray()
+    for field in BINARY_FIELDS:
+        if field == "conf":
+            values = array("b", (max(-1, min(100, v)) for v in words[field]))
+        else:
+            values = array("H", (max(0, min(0xFFFF, v)) for v in words[field]))
+            if sys.byteorder == "big":
+                values.byteswap()
+        raw += values.tobytes()
+    return {
+        "format": "binary",
+        "count": count,
+        "text": words["text"],
+        "fields": [f"{f}:{'i8' if f == 'conf' else 'u16le'}" for f in BINARY_FIELDS],
+        "data_b64": base64.b64encode(bytes(raw)).decode("ascii"),
+    }
+
+
+def ocr_image(
+    image,
+    timeout: int,
+    layout: Optional[str] = None,
+    profile: Optional[OcrProfile] = None,
+) -> Dict[str, Any]:
+    """OCR de una imagen en escala de grises (PIL o ruta a archivo). Con 'layout' incluye las cajas de palabras."""
+    import pytesseract  # Import diferido: solo lo pagan los workers que hacen OCR.
+    profile = profile or OCR_PROFILES[DEFAULT_OCR_PROFILE]
+    kwargs = {"lang": profile.lang, "config": profile.config, "timeout": timeout}
+    if not layout:
+        return {"text": pytesseract.image_to_string(image, **kwargs).strip()}
+    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, **kwargs)
+    words = words_from_data(data)
+    return {"text": text_from_words(words).strip(), "words": encode_words(words, layout)}
@@ -0,0 +1,149 @@
+"""
+Render de páginas PDF con Poppler trabajando sobre archivos.
+
+pdf2image.convert_from_bytes escribe el PDF a un archivo temporal nuevo en
+cada llamada (una por página en el OCR) y devuelve las páginas decodificadas
+por un pipe. Aquí el PDF se escribe una sola vez por petición a un archivo
+en RENDER_SPOOL_DIR (tmpfs si existe /dev/shm), o se reutiliza el archivo
+temporal en el que Starlette ya volcó el multipart, y Poppler escribe cada
+página a un archivo que se pasa tal cual a Tesseract (PGM sin comprimir) o
+se lee con mmap (JPEG para /pdf-to-images).
+"""
+
+import base64
+import hashlib
+import mmap
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, List, Union
+
+RENDER_SPOOL_DIR = os.getenv("RENDER_SPOOL_DIR") or (
+    "/dev/shm" if os.access("/dev/shm", os.W_OK) else tempfile.gettempdir()
+)
+# Reutiliza el temporal del multipart vía /proc/<pid>/fd en lugar de copiarlo (solo Linux).
+RENDER_REUSE_UPLOAD_SPOOL = os.getenv("RENDER_REUSE_UPLOAD_SPOOL", "1") == "1"
+_CHUNK_BYTES = 1024 * 1024
+
+
+class SpooledPdf:
+    """PDF accesible por ruta para Poppler. Borra el archivo al cerrarse si lo creó."""
+
+    def __init__(self, path: str, size: int, sha256: str, owned: bool):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self._owned = owned
+
+    def close(self) -> None:
+        if self._owned:
+            self._owned = False
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self) -> "SpooledPdf":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _upload_fd_path(src: BinaryIO) -> Union[str, None]:
+    """
+    Ruta /proc del archivo del upload si ya está en disco; None si hay que copiarlo.
+
+    Best-effort: un SpooledTemporaryFile no expone de forma pública si ya pasó
+    a disco (fileno() lo forzaría a escribirse en /tmp), así que se consulta su
+    atributo interno '_rolled' solo si existe. Si una versión de Python lo
+    cambia, o ante cualquier duda, se copia a RENDER_SPOOL_DIR como siempre.
+    Un archivo real (TemporaryFile, open) se reconoce con fstat.
+    """
+    if not RENDER_REUSE_UPLOAD_SPOOL:
+        return None
+    if isinstance(src, tempfile.SpooledTemporaryFile) and getattr(src, "_rolled", None) is not True:
+        return None
+    try:
+        fd = src.fileno()
+        if not stat.S_ISREG(os.fstat(fd).st_mode):
+            return None
+    except (AttributeError, OSError, ValueError):
+        return None
+    path = f"/proc/{os.getpid()}/fd/{fd}"
+    return path if os.path.exists(path) else None
+
+
+def spool_pdf(src: Union[bytes, BinaryIO]) -> SpooledPdf:
+    """
+    Deja el PDF en un archivo y calcula su sha256 en la misma pasada.
+    Acepta bytes o el archivo de un UploadFile (UploadFile.file).
+    """
+    digest = hashlib.sha256()
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        fd, path = tempfile.mkstemp(suffix=".pdf", dir=RENDER_SPOOL_DIR)
+        with os.fdopen(fd, "wb") as out:
+            out.write(src)
+        digest.update(src)
+        return SpooledPdf(path, len(src), digest.hexdigest(), owned=True)
+
+    src.seek(0)
+    reused = _upload_fd_path(src)
+    if reused is not None:
+        size = 0
+        while chunk := src.read(_CHUNK_BYTES):
+            digest.update(chunk)
+            size += len(chunk)
+        src.seek(0)
+        return SpooledPdf(reused, size, digest.hexdigest(), owned=False)
+
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=RENDER_SPOOL_DIR)
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := src.read(_CHUNK_BYTES):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    src.seek(0)
+    return SpooledPdf(path, size, digest.hexdigest(), owned=True)
+
+
+def pdf_page_count(pdf_path: str) -> int:
+    from pdf2image import pdfinfo_from_path
+
+    return int(pdfinfo_from_path(pdf_path).get("Pages", 0))
+
+
+@contextmanager
+def render_page_gray(pdf_path: str, page: int, dpi: int, timeout: int) -> Iterator[str]:
+    """Renderiza una página en escala de grises (PGM) y entrega la ruta mientras dure el bloque."""
+    from pdf2image import convert_from_path
+
+    with tempfile.TemporaryDirectory(dir=RENDER_SPOOL_DIR) as out_dir:
+        paths = convert_from_path(
+            pdf_path, dpi=dpi, first_page=page, last_page=page, timeout=timeout,
+            grayscale=True, output_folder=out_dir, output_file="page",
+            single_file=True, paths_only=True,
+        )
+        yield paths[0]
+
+
+def render_pages_jpeg_b64(pdf_path: str, dpi: int, quality: int) -> List[str]:
+    """Renderiza todas las páginas a JPEG con Poppler y las devuelve en base64 (leídas con mmap)."""
+    from pdf2image import convert_from_path
+
+    with tempfile.TemporaryDirectory(dir=RENDER_SPOOL_DIR) as out_dir:
+        paths = convert_from_path(
+            pdf_path, dpi=dpi, fmt="jpeg", jpegopt={"quality": quality},
+            output_folder=out_dir, output_file="page", paths_only=True,
+        )
+        encoded = []
+        for path in paths:
+            with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                encoded.append(base64.b64encode(data).decode("ascii"))
+        return encoded
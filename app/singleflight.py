@@ -0,0 +1,175 @@
+"""
+Coalescencia de trabajos idénticos en curso ("single-flight").
+
+Si llega una petición cuyo trabajo (misma clave: hash del PDF + parámetros)
+ya se está ejecutando, se espera ese mismo resultado en lugar de lanzar un
+segundo OCR. Dentro de un worker se comparte la tarea asyncio; entre workers
+de gunicorn se coordina con archivos en SINGLEFLIGHT_DIR:
+
+    <key>.lock  el worker que ejecuta el trabajo mantiene un flock exclusivo
+                sobre este archivo mientras dura el trabajo
+    <key>.json  resultado, escrito antes de soltar el .lock y conservado
+                SINGLEFLIGHT_RESULT_TTL_SECONDS para los que estaban esperando
+
+Si el dueño falla, suelta el lock sin resultado y el siguiente que espera
+toma el trabajo. Si el worker muere (OOM, kill) el kernel libera el flock y
+ocurre lo mismo de inmediato. Los .lock abandonados con más de
+SINGLEFLIGHT_STALE_SECONDS se borran del directorio.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+SINGLEFLIGHT_DIR = os.getenv(
+    "SINGLEFLIGHT_DIR", os.path.join(tempfile.gettempdir(), "pdf2image-inflight")
+)
+SINGLEFLIGHT_POLL_SECONDS = float(os.getenv("SINGLEFLIGHT_POLL_SECONDS", "0.25"))
+SINGLEFLIGHT_STALE_SECONDS = int(os.getenv("SINGLEFLIGHT_STALE_SECONDS", "300"))
+# Solo debe cubrir a quienes ya estaban esperando (sondean cada SINGLEFLIGHT_POLL_SECONDS); no es un caché.
+SINGLEFLIGHT_RESULT_TTL_SECONDS = int(os.getenv("SINGLEFLIGHT_RESULT_TTL_SECONDS", "5"))
+
+_inflight: Dict[str, "asyncio.Future[Any]"] = {}
+# Descriptores de los .lock que este worker tiene tomados (flock), por clave.
+_held: Dict[str, int] = {}
+
+
+class SingleFlightTimeout(Exception):
+    pass
+
+
+def _path(key: str, ext: str) -> str:
+    return os.path.join(SINGLEFLIGHT_DIR, f"{key}.{ext}")
+
+
+def _flock_path(path: str) -> Optional[int]:
+    """
+    Abre 'path' y toma un flock exclusivo sin esperar. Devuelve el descriptor,
+    o None si otro lo tiene o si el archivo se borró/reemplazó mientras tanto.
+    """
+    fd = os.open(path, os.O_CREAT | os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if os.fstat(fd).st_ino == os.stat(path).st_ino:
+            return fd
+    except (BlockingIOError, FileNotFoundError):
+        pass
+    os.close(fd)
+    return None
+
+
+def _try_lock(key: str) -> bool:
+    os.makedirs(SINGLEFLIGHT_DIR, exist_ok=True)
+    fd = _flock_path(_path(key, "lock"))
+    if fd is None:
+        return False
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    _held[key] = fd
+    return True
+
+
+def _release_lock(key: str) -> None:
+    # Se borra antes de cerrar: quien abra el archivo viejo detecta el cambio de inodo.
+    _remove(_path(key, "lock"))
+    fd = _held.pop(key, None)
+    if fd is not None:
+        os.close(fd)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _read_result(key: str) -> Optional[Any]:
+    path = _path(key, "json")
+    try:
+        if time.time() - os.path.getmtime(path) > SINGLEFLIGHT_RESULT_TTL_SECONDS:
+            _remove(path)
+            return None
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_result(key: str, result: Any) -> None:
+    tmp = _path(key, f"{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(result, fh)
+    os.replace(tmp, _path(key, "json"))
+
+
+def purge_stale_files() -> None:
+    """Borra resultados vencidos y locks abandonados (se llama al iniciar cada trabajo)."""
+    if not os.path.isdir(SINGLEFLIGHT_DIR):
+        return
+    now = time.time()
+    for name in os.listdir(SINGLEFLIGHT_DIR):
+        path = os.path.join(SINGLEFLIGHT_DIR, name)
+        is_lock = name.endswith(".lock")
+        max_age = SINGLEFLIGHT_STALE_SECONDS if is_lock else SINGLEFLIGHT_RESULT_TTL_SECONDS
+        try:
+            if now - os.path.getmtime(path) <= max_age:
+                continue
+        except FileNotFoundError:
+            continue
+        if not is_lock:
+            _remove(path)
+            continue
+        # Un lock viejo solo se borra si nadie lo tiene tomado (su worker murió).
+        fd = _flock_path(path)
+        if fd is not None:
+            _remove(path)
+            os.close(fd)
+
+
+async def _lead(key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+    try:
+        result = await factory()
+        _write_result(key, result)
+        return result
+    finally:
+        _release_lock(key)
+
+
+async def run_once(
+    key: str,
+    factory: Callable[[], Awaitable[Any]],
+    timeout: float,
+) -> Tuple[Any, bool]:
+    """
+    Ejecuta factory() una sola vez por clave entre todas las peticiones en curso.
+    Devuelve (resultado, compartido); compartido=True si se reutilizó el trabajo de otra petición.
+    El resultado debe ser serializable a JSON. SingleFlightTimeout si se espera más de 'timeout'.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        task = _inflight.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+        # El resultado se revisa antes que el lock: el dueño lo escribe y recién después suelta el lock.
+        result = _read_result(key)
+        if result is not None:
+            return result, True
+        if _try_lock(key):
+            # El dueño anterior pudo publicar el resultado justo antes de soltar el lock.
+            result = _read_result(key)
+            if result is not None:
+                _release_lock(key)
+                return result, True
+            purge_stale_files()
+            task = asyncio.ensure_future(_lead(key, factory))
+            _inflight[key] = task
+            task.add_done_callback(lambda _: _inflight.pop(key, None))
+            return await asyncio.shield(task), False
+        if time.monotonic() > deadline:
+            raise SingleFlightTimeout("Tiempo agotado esperando un trabajo idéntico en curso.")
+        await asyncio.sleep(SINGLEFLIGHT_POLL_SECONDS)
@@ -0,0 +1,26 @@
+import io
+
+from pypdf import PdfReader
+
+
+def make_pdf(*textos, image_px=None):
+    """PDF con una página por texto; con image_px agrega a cada página una imagen de ruido de ese tamaño."""
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.utils import ImageReader
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    for texto in textos:
+        c.drawString(100, 750, texto)
+        if image_px:
+            img = Image.effect_noise((image_px, image_px), 64).convert("RGB")
+            c.drawImage(ImageReader(img), 100, 300, width=300, height=300)
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def page_texts(pdf_bytes):
+    return [p.extract_text().strip() for p in PdfReader(io.BytesIO(pdf_bytes)).pages]
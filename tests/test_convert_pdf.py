@@ -91,3 +91,70 @@ class TestEndpointConvertPdf:
         for i, page in enumerate(data["pages"]):
             assert page["page"] == i + 1
             assert "text" in page
+
+
+class TestConvertPdfTimeouts:
+    """Presupuesto por página y resultados parciales (render + OCR simulados)."""
+
+    @pytest.fixture
+    def fake_pages(self, monkeypatch, tmp_path):
+        import app.main as main
+        from app import singleflight
+
+        monkeypatch.setattr(singleflight, "SINGLEFLIGHT_DIR", str(tmp_path))
+
+        calls = []
+
+        def fake_ocr_page(pdf_path, page, dpi, timeout, layout, profile):
+            calls.append((page, dpi))
+            if page == 2 and dpi == main.PDF_DPI:
+                raise RuntimeError("Tesseract process timeout")
+            if page == 3:
+                raise RuntimeError("Tesseract process timeout")
+            return {"text": f"pagina {page}"}
+
+        monkeypatch.setattr(main, "check_pdf_pages", lambda pdf_path: 3)
+        monkeypatch.setattr(main, "ocr_page", fake_ocr_page)
+        return calls
+
+    def test_partial_results(self, fake_pages):
+        import app.main as main
+
+        hi, lo = main.PDF_DPI, main.OCR_RETRY_DPI
+        files = {"file": ("a.pdf", b"%PDF-1.4", "application/pdf")}
+        response = client.post("/convert-pdf", files=files)
+        assert response.status_code == 200
+
+        data = response.json()
+        assert data["partial"] is True
+        assert data["status"] == "partial"
+        assert [p["status"] for p in data["pages"]] == ["ok", "ok", "timeout"]
+        assert data["pages"][1]["text"] == "pagina 2"
+        assert data["pages"][1]["dpi"] == lo
+        assert data["pages"][2]["text"] == ""
+        # Cada página que agota su tiempo se reintenta una sola vez a menor DPI
+        assert fake_pages == [(1, hi), (2, hi), (2, lo), (3, hi), (3, lo)]
+
+    def test_deadline_skips_remaining_pages(self, fake_pages, monkeypatch):
+        import app.main as main
+
+        monkeypatch.setattr(main, "OCR_REQUEST_DEADLINE_SECONDS", 0)
+        files = {"file": ("a.pdf", b"%PDF-1.4", "application/pdf")}
+        response = client.post("/convert-pdf", files=files)
+        assert response.status_code == 504
+        assert fake_pages == []
+
+    def test_non_timeout_errors_still_fail(self, monkeypatch, tmp_path):
+        import app.main as main
+        from app import singleflight
+
+        monkeypatch.setattr(singleflight, "SINGLEFLIGHT_DIR", str(tmp_path))
+
+        def broken(*args):
+            raise RuntimeError("tesseract no instalado")
+
+        monkeypatch.setattr(main, "check_pdf_pages", lambda pdf_path: 1)
+        monkeypatch.setattr(main, "ocr_page", broken)
+        files = {"file": ("a.pdf", b"%PDF-1.4", "application/pdf")}
+        response = client.post("/convert-pdf", files=files)
+        assert response.status_code == 500
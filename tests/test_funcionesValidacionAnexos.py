@@ -7,7 +7,8 @@ from app.funcionesValidacionAnexos import (
     digits_only,
     tokenize_words,
     fuzzy_ratio,
-    limpiar_texto_validacion
+    limpiar_texto_validacion,
+    verificar_candidatos_por_pagina
 )
 
 class TestDigitsOnly:
@@ -142,4 +143,47 @@ class TestVerificarPersona:
             documento="123456789",
             texto_limpio="documento 123456789 sin nombre"
         )
-        assert result["score"] == 20  # 0 nombre + 20 documento + 0 penalización
\ No newline at end of file
+        assert result["score"] == 20  # 0 nombre + 20 documento + 0 penalización
+
+
+class TestVerificarCandidatosPorPagina:
+    def test_pagina_donde_se_encuentra(self):
+        paginas = [(1, "Factura de servicios"), (2, "Paciente: Juan Pérez CC 123456789")]
+        result = verificar_candidatos_por_pagina(paginas, [{"nombre": "juan perez", "documento": "123456789"}])
+        res = result["resultados"][0]
+        assert res["score"] == 100
+        assert res["aprobado"] is True
+        assert res["pagina"] == 2
+        assert result["paginas_procesadas"] == 2
+
+    def test_nombre_y_documento_en_paginas_distintas(self):
+        paginas = [(1, "Juan Perez"), (2, "Documento 123456789")]
+        result = verificar_candidatos_por_pagina(paginas, [{"nombre": "juan perez", "documento": "123456789"}], umbral=100)
+        assert result["resultados"][0]["pagina"] == 2
+
+    def test_detiene_cuando_todos_aprueban(self):
+        consumidas = []
+
+        def paginas():
+            for n in range(1, 6):
+                consumidas.append(n)
+                yield n, "juan perez 123456789 maria lopez 987654321" if n == 2 else "anexo"
+
+        candidatos = [
+            {"nombre": "juan perez", "documento": "123456789"},
+            {"nombre": "maria lopez", "documento": "987654321"},
+        ]
+        result = verificar_candidatos_por_pagina(paginas(), candidatos)
+        assert consumidas == [1, 2]
+        assert result["detenido_anticipadamente"] is True
+        assert [r["pagina"] for r in result["resultados"]] == [2, 2]
+
+    def test_sin_coincidencia_procesa_todo(self):
+        paginas = [(1, "anexo"), (2, "otro anexo")]
+        result = verificar_candidatos_por_pagina(paginas, [{"nombre": "pedro", "documento": "999999999"}])
+        res = result["resultados"][0]
+        assert res["aprobado"] is False
+        assert res["pagina"] is None
+        assert res["score"] == 0
+        assert result["paginas_procesadas"] == 2
+        assert result["detenido_anticipadamente"] is False
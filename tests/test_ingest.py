@@ -0,0 +1,161 @@
+import base64
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.ingest import JsonStreamError, MergeJsonStreamParser
+from app.main import app
+from conftest import make_pdf
+
+client = TestClient(app)
+
+
+def parse(body: bytes, chunk_size: int):
+    parser = MergeJsonStreamParser()
+    for i in range(0, len(body), chunk_size):
+        parser.feed(body[i:i + chunk_size])
+    return parser.close()
+
+
+class TestMergeJsonStreamParser:
+    @pytest.mark.parametrize("chunk_size", [1, 3, 7, 4096])
+    def test_decodes_data_b64_in_chunks(self, chunk_size):
+        blobs = [b"%PDF-uno" * 50, bytes(range(256))]
+        payload = {
+            "files": [{"name": "á.pdf", "data_b64": base64.b64encode(b).decode(), "pages": "1-2"} for b in blobs],
+            "compress": True,
+            "max_image_px": 1200,
+            "extra": [1.5, None, False, {"x": "y\"z"}],
+        }
+        body, spools = parse(json.dumps(payload).encode(), chunk_size)
+
+        assert [s.file.read() for s in spools] == blobs
+        assert all(s.error is None for s in spools)
+        assert body["files"][0] == {"name": "á.pdf", "data_b64": "", "pages": "1-2"}
+        assert body["compress"] is True and body["max_image_px"] == 1200
+        assert body["extra"] == payload["extra"]
+
+    def test_escaped_slashes(self):
+        data = base64.b64encode(b"\xff\xfe\xfd" * 30).decode()
+        body = '{"files":[{"data_b64":"%s"}]}' % data.replace("/", "\\/")
+        _, spools = parse(body.encode(), 5)
+        assert spools[0].file.read() == b"\xff\xfe\xfd" * 30
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 4096])
+    def test_unicode_escapes_in_data_b64(self, chunk_size):
+        # "QU\u004aD" es "QUJD" con la J escapada; también un "\n" entre líneas y "\/".
+        body = b'{"files":[{"data_b64":"QU\\u004aD\\n\\/\\/\\/\\/"}]}'
+        _, spools = parse(body, chunk_size)
+        assert spools[0].error is None
+        assert spools[0].file.read() == b"ABC" + base64.b64decode("////")
+
+    @pytest.mark.parametrize("escape", [b"\\x41", b"\\u00", b'\\"', b"\\u0021"])
+    def test_bad_escapes_in_data_b64_are_reported(self, escape):
+        _, spools = parse(b'{"files":[{"data_b64":"QUJD' + escape + b'"}]}', 3)
+        assert spools[0].error is not None
+
+    def test_long_literal_same_result_for_any_chunking(self):
+        body = b'{"files":[], "n": ' + b"1" * 40 + b"}"
+        whole, _ = parse(body, len(body))
+        split, _ = parse(body, 7)
+        assert whole == split == {"files": [], "n": int("1" * 40)}
+
+        huge = b'{"n": ' + b"1" * 2000 + b"}"
+        for chunk_size in (len(huge), 7):
+            with pytest.raises(JsonStreamError):
+                parse(huge, chunk_size)
+
+    def test_invalid_base64_is_reported_per_file(self):
+        _, spools = parse(b'{"files":[{"data_b64":"QUJD"},{"data_b64":"QUJ"}]}', 4)
+        assert spools[0].error is None
+        assert spools[1].error is not None
+
+    @pytest.mark.parametrize("body", [b'{"files":[', b'{"files" 1}', b'{"files":[}', b"[1,]", b'{"a":tru}', b'{"a":01}', b'{"a":-00.5}'])
+    def test_malformed_json(self, body):
+        with pytest.raises(JsonStreamError):
+            parse(body, 2)
+
+
+class TestEndpointMergePdfJsonStreaming:
+    def test_merge_success(self):
+        payload = {"files": [
+            {"name": "a.pdf", "data_b64": base64.b64encode(make_pdf("a1", "a2")).decode()},
+            {"name": "b.pdf", "data_b64": base64.b64encode(make_pdf("b1")).decode()},
+        ]}
+        response = client.post("/merge-pdf-json", json=payload)
+        assert response.status_code == 200
+        assert response.headers["X-Merged-Pages"] == "3"
+
+    def test_per_file_error_report(self):
+        payload = {"files": [
+            {"name": "ok.pdf", "data_b64": base64.b64encode(make_pdf("a1")).decode()},
+            {"name": "roto.pdf", "data_b64": base64.b64encode(b"no es un pdf").decode()},
+            {"name": "malo.pdf", "data_b64": "QUJ"},
+        ]}
+        response = client.post("/merge-pdf-json", json=payload)
+        assert response.status_code == 400
+
+        files = response.json()["detail"]["files"]
+        assert [f["ok"] for f in files] == [True, False, False]
+        assert files[0]["pages"] == 1
+        assert files[1]["name"] == "roto.pdf" and files[1]["error"]
+        assert "base64" in files[2]["error"]
+
+    def test_missing_data_b64_is_validation_error(self):
+        response = client.post("/merge-pdf-json", json={"files": [{"name": "a.pdf"}]})
+        assert response.status_code == 422
+
+    def test_spools_closed_when_json_fails(self, monkeypatch):
+        from app import ingest
+
+        created = []
+        original = ingest.Base64Spool
+
+        def tracking_spool(index):
+            spool = original(index)
+            created.append(spool)
+            return spool
+
+        monkeypatch.setattr(ingest, "Base64Spool", tracking_spool)
+        body = b'{"files":[{"data_b64":"QUJD"}, {"data_b64":"QUJD"}'
+        response = client.post("/merge-pdf-json", content=body, headers={"Content-Type": "application/json"})
+        assert response.status_code == 400
+        assert len(created) == 2
+        assert all(spool.file.closed for spool in created)
+
+    def test_duplicate_data_b64_is_rejected(self, monkeypatch):
+        from app import ingest
+
+        created = []
+        original = ingest.Base64Spool
+
+        def tracking_spool(index):
+            spool = original(index)
+            created.append(spool)
+            return spool
+
+        monkeypatch.setattr(ingest, "Base64Spool", tracking_spool)
+        body = b'{"files":[{"data_b64":"QUJD","data_b64":"QUJD"}]}'
+        response = client.post("/merge-pdf-json", content=body, headers={"Content-Type": "application/json"})
+        assert response.status_code == 400
+        assert "duplicado" in response.json()["detail"]
+        assert len(created) == 1 and created[0].file.closed
+
+    def test_number_with_leading_zero_is_bad_request(self):
+        body = b'{"files": [], "max_image_px": 01}'
+        response = client.post("/merge-pdf-json", content=body, headers={"Content-Type": "application/json"})
+        assert response.status_code == 400
+
+    def test_invalid_json(self):
+        response = client.post("/merge-pdf-json", content=b'{"files": [', headers={"Content-Type": "application/json"})
+        assert response.status_code == 400
+
+    def test_multipart_per_file_error_report(self):
+        files = [
+            ("files", ("a.pdf", make_pdf("a1"), "application/pdf")),
+            ("files", ("b.pdf", b"", "application/pdf")),
+        ]
+        response = client.post("/merge-pdf", files=files)
+        assert response.status_code == 400
+        assert [f["ok"] for f in response.json()["detail"]["files"]] == [True, False]
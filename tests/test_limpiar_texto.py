@@ -94,4 +94,51 @@ class TestEndpointLimpiarTexto:
 
         data = response.json()
         assert len(data["texto_limpio"]) > 0
-        assert data["longitud"] == len(data["texto_limpio"])
\ No newline at end of file
+        assert data["longitud"] == len(data["texto_limpio"])
+
+class TestEndpointLimpiarTextoLote:
+    def test_lote_textos(self):
+        payload = {"textos": ["Hola    MUNDO", "", "Documento: 123-456"]}
+        response = client.post("/limpiar-texto/lote", json=payload)
+        assert response.status_code == 200
+
+        data = response.json()
+        assert data["total"] == 3
+        assert [r["texto_limpio"] for r in data["resultados"]] == ["hola mundo", "", "documento 123456"]
+        assert all(r["longitud"] == len(r["texto_limpio"]) for r in data["resultados"])
+
+    def test_lote_pages_de_convert_pdf(self):
+        payload = {"pages": [{"page": 1, "text": "Juan PEREZ"}, {"page": 2, "text": "CC 123"}], "partial": False}
+        response = client.post("/limpiar-texto/lote", json=payload)
+        assert response.status_code == 200
+        assert response.json()["resultados"] == [
+            {"texto_limpio": "juan perez", "longitud": 10, "page": 1},
+            {"texto_limpio": "cc 123", "longitud": 6, "page": 2},
+        ]
+
+    def test_lote_en_pool_de_procesos(self, monkeypatch):
+        import app.main as main
+
+        monkeypatch.setattr(main, "LIMPIEZA_POOL_MIN_CHARS", 0)
+        textos = [f"Texto NÚMERO {i}!!" for i in range(50)]
+        response = client.post("/limpiar-texto/lote", json={"textos": textos})
+        assert response.status_code == 200
+        assert [r["texto_limpio"] for r in response.json()["resultados"]] == [
+            f"texto número {i}" for i in range(50)
+        ]
+
+    def test_pool_recreado_tras_reiniciar_lifespan(self, monkeypatch):
+        import app.main as main
+
+        monkeypatch.setattr(main, "LIMPIEZA_POOL_MIN_CHARS", 0)
+        for _ in range(2):
+            with TestClient(app) as ciclo:
+                response = ciclo.post("/limpiar-texto/lote", json={"textos": ["Hola MUNDO"]})
+                assert response.status_code == 200
+                assert response.json()["resultados"][0]["texto_limpio"] == "hola mundo"
+        assert main.limpieza_pool is None
+
+    def test_lote_requiere_un_solo_campo(self):
+        assert client.post("/limpiar-texto/lote", json={}).status_code == 400
+        payload = {"textos": ["a"], "pages": [{"page": 1, "text": "b"}]}
+        assert client.post("/limpiar-texto/lote", json=payload).status_code == 400
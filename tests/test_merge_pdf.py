@@ -0,0 +1,191 @@
+import base64
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from pypdf import PdfReader
+
+from app.main import app
+from app.merge import PdfMergeError, merge_pdfs_from_bytes, parse_page_ranges
+from conftest import make_pdf, page_texts
+
+client = TestClient(app)
+
+
+class TestParsePageRanges:
+    def test_all_pages(self):
+        assert parse_page_ranges(None, 3) == [0, 1, 2]
+        assert parse_page_ranges("", 3) == [0, 1, 2]
+
+    def test_ranges_and_order(self):
+        assert parse_page_ranges("3,1-2", 4) == [2, 0, 1]
+        assert parse_page_ranges("2-", 4) == [1, 2, 3]
+
+    def test_out_of_range(self):
+        with pytest.raises(PdfMergeError):
+            parse_page_ranges("5", 4)
+
+    def test_invalid(self):
+        with pytest.raises(PdfMergeError):
+            parse_page_ranges("a-b", 4)
+
+
+class TestMergePdfOptions:
+    def test_page_ranges_per_input(self):
+        merged, total = merge_pdfs_from_bytes(
+            [make_pdf("a1", "a2", "a3"), make_pdf("b1", "b2")],
+            page_ranges=["1,3", None],
+        )
+        assert total == 4
+        assert page_texts(merged) == ["a1", "a3", "b1", "b2"]
+
+    def test_dedupe_identical_pages(self):
+        portada = make_pdf("portada")
+        merged, total = merge_pdfs_from_bytes(
+            [portada, make_pdf("anexo 1"), portada, make_pdf("anexo 1", "anexo 2")],
+            dedupe_pages=True,
+        )
+        assert total == 3
+        assert page_texts(merged) == ["portada", "anexo 1", "anexo 2"]
+
+    def test_dedupe_keeps_forms_with_different_values(self):
+        def form(valor):
+            from reportlab.pdfgen import canvas
+            from reportlab.lib.pagesizes import letter
+
+            buffer = io.BytesIO()
+            c = canvas.Canvas(buffer, pagesize=letter)
+            c.drawString(100, 750, "Nombre del paciente:")
+            c.acroForm.textfield(name="nombre", value=valor, x=100, y=700, width=300, height=20)
+            c.showPage()
+            c.save()
+            return buffer.getvalue()
+
+        merged, total = merge_pdfs_from_bytes([form("JUAN PEREZ"), form("MARIA LOPEZ")], dedupe_pages=True)
+        assert total == 2
+        # La misma planilla con el mismo valor sí es un duplicado.
+        _, total = merge_pdfs_from_bytes([form("JUAN PEREZ"), form("JUAN PEREZ")], dedupe_pages=True)
+        assert total == 1
+
+    def test_dedupe_looks_inside_nested_form_xobjects(self):
+        from pypdf import PdfWriter
+        from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, NameObject, NumberObject
+
+        def annex(pixel: bytes):
+            # Página "q /Fm0 Do Q" cuyo formulario /Fm0 dibuja /Im0 desde sus propios recursos.
+            writer = PdfWriter()
+            page = writer.add_blank_page(200, 200)
+            image = DecodedStreamObject()
+            image.set_data(pixel * 4)
+            image.update({
+                NameObject("/Type"): NameObject("/XObject"), NameObject("/Subtype"): NameObject("/Image"),
+                NameObject("/Width"): NumberObject(2), NameObject("/Height"): NumberObject(2),
+                NameObject("/ColorSpace"): NameObject("/DeviceGray"), NameObject("/BitsPerComponent"): NumberObject(8),
+            })
+            form = DecodedStreamObject()
+            form.set_data(b"q 200 0 0 200 0 0 cm /Im0 Do Q")
+            form.update({
+                NameObject("/Type"): NameObject("/XObject"), NameObject("/Subtype"): NameObject("/Form"),
+                NameObject("/BBox"): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(200), FloatObject(200)]),
+                NameObject("/Resources"): DictionaryObject({NameObject("/XObject"): DictionaryObject(
+                    {NameObject("/Im0"): writer._add_object(image)})}),
+            })
+            contents = DecodedStreamObject()
+            contents.set_data(b"q /Fm0 Do Q")
+            page[NameObject("/Contents")] = writer._add_object(contents)
+            page[NameObject("/Resources")] = DictionaryObject({NameObject("/XObject"): DictionaryObject(
+                {NameObject("/Fm0"): writer._add_object(form)})})
+            out = io.BytesIO()
+            writer.write(out)
+            return out.getvalue()
+
+        _, total = merge_pdfs_from_bytes([annex(b"\x00"), annex(b"\xff")], dedupe_pages=True)
+        assert total == 2
+        _, total = merge_pdfs_from_bytes([annex(b"\x00"), annex(b"\x00")], dedupe_pages=True)
+        assert total == 1
+
+    def test_dedupe_keeps_rotated_copy(self):
+        from pypdf import PdfWriter
+
+        blob = make_pdf("portada")
+        writer = PdfWriter(clone_from=io.BytesIO(blob))
+        writer.pages[0].rotate(90)
+        rotated = io.BytesIO()
+        writer.write(rotated)
+        _, total = merge_pdfs_from_bytes([blob, rotated.getvalue()], dedupe_pages=True)
+        assert total == 2
+
+    def test_compress_shares_identical_objects(self):
+        blob = make_pdf("igual", image_px=64)
+        plain, _ = merge_pdfs_from_bytes([blob, blob, blob])
+        compressed, total = merge_pdfs_from_bytes([blob, blob, blob], compress=True)
+        assert total == 3
+        assert len(compressed) < len(plain)
+
+    def test_downsample_images(self):
+        merged, _ = merge_pdfs_from_bytes([make_pdf("foto", image_px=400)], max_image_px=100)
+        image = PdfReader(io.BytesIO(merged)).pages[0].images[0].image
+        assert max(image.size) <= 100
+
+    def test_downsample_never_grows_output(self):
+        from PIL import Image, ImageDraw
+        from reportlab.pdfgen import canvas
+        from reportlab.lib.utils import ImageReader
+
+        # Escaneo bitonal de texto: comprime mucho mejor que su versión JPEG reducida.
+        scan = Image.new("1", (2400, 3000), 1)
+        draw = ImageDraw.Draw(scan)
+        for y in range(100, 2900, 40):
+            draw.text((100, y), "Factura de servicios de salud 123456789 " * 3, fill=0)
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer)
+        c.drawImage(ImageReader(scan), 0, 0, width=595, height=842)
+        c.showPage()
+        c.save()
+
+        plain, _ = merge_pdfs_from_bytes([buffer.getvalue()])
+        reduced, _ = merge_pdfs_from_bytes([buffer.getvalue()], max_image_px=1500)
+        assert len(reduced) <= len(plain)
+
+
+class TestEndpointMergePdf:
+    def test_merge_pdf_with_pages_and_dedupe(self):
+        files = [
+            ("files", ("a.pdf", make_pdf("a1", "a2"), "application/pdf")),
+            ("files", ("b.pdf", make_pdf("a1", "b2"), "application/pdf")),
+        ]
+        data = {"pages": ["", "1"], "dedupe_pages": "true"}
+        response = client.post("/merge-pdf", files=files, data=data)
+        assert response.status_code == 200
+        assert response.headers["X-Merged-Pages"] == "2"
+
+    def test_merge_pdf_json_with_pages(self):
+        payload = {
+            "files": [
+                {"name": "a.pdf", "data_b64": base64.b64encode(make_pdf("a1", "a2")).decode(), "pages": "2"},
+                {"name": "b.pdf", "data_b64": base64.b64encode(make_pdf("b1")).decode()},
+            ],
+            "compress": True,
+        }
+        response = client.post("/merge-pdf-json", json=payload)
+        assert response.status_code == 200
+        assert page_texts(response.content) == ["a2", "b1"]
+
+    def test_merge_pdf_json_bad_range(self):
+        payload = {"files": [{"data_b64": base64.b64encode(make_pdf("a1")).decode(), "pages": "3"}]}
+        response = client.post("/merge-pdf-json", json=payload)
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("value", ["0", "-5"])
+    def test_max_image_px_must_be_positive(self, value):
+        files = [("files", ("a.pdf", make_pdf("a1"), "application/pdf"))]
+        response = client.post("/merge-pdf", files=files, data={"max_image_px": value})
+        assert response.status_code == 422
+
+        payload = {"files": [{"data_b64": base64.b64encode(make_pdf("a1")).decode()}], "max_image_px": int(value)}
+        assert client.post("/merge-pdf-json", json=payload).status_code == 422
+
+        session_id = client.post("/merge-sessions").json()["session_id"]
+        response = client.post(f"/merge-sessions/{session_id}/finalize?max_image_px={value}")
+        assert response.status_code == 422
+        client.delete(f"/merge-sessions/{session_id}")
@@ -0,0 +1,170 @@
+import base64
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import merge_sessions
+from app.main import app
+from conftest import make_pdf, page_texts
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def session_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(merge_sessions, "MERGE_SESSION_DIR", str(tmp_path))
+    return tmp_path
+
+
+class TestMergeSessions:
+    def test_append_and_finalize(self, session_dir):
+        session_id = client.post("/merge-sessions").json()["session_id"]
+
+        files = {"files": ("a.pdf", make_pdf("pagina a1", "pagina a2"), "application/pdf")}
+        response = client.post(f"/merge-sessions/{session_id}/files", files=files)
+        assert response.status_code == 200
+        assert response.json()["total_pages"] == 2
+
+        payload = {"files": [{"name": "b.pdf", "data_b64": base64.b64encode(make_pdf("pagina b1")).decode()}]}
+        response = client.post(f"/merge-sessions/{session_id}/files-json", json=payload)
+        assert response.status_code == 200
+        assert response.json()["files"] == 2
+        assert response.json()["total_pages"] == 3
+
+        response = client.post(f"/merge-sessions/{session_id}/finalize")
+        assert response.status_code == 200
+        assert response.headers["X-Merged-Pages"] == "3"
+        assert page_texts(response.content) == ["pagina a1", "pagina a2", "pagina b1"]
+
+        # La sesión se elimina después de finalizar
+        assert client.get(f"/merge-sessions/{session_id}").status_code == 404
+
+    def test_reorder_and_remove_pages(self):
+        session_id = client.post("/merge-sessions").json()["session_id"]
+        files = {"files": ("a.pdf", make_pdf("uno", "dos", "tres"), "application/pdf")}
+        client.post(f"/merge-sessions/{session_id}/files", files=files)
+
+        response = client.put(f"/merge-sessions/{session_id}/pages", json={"pages": [3, 1]})
+        assert response.status_code == 200
+        assert response.json()["total_pages"] == 2
+
+        response = client.post(f"/merge-sessions/{session_id}/finalize")
+        assert page_texts(response.content) == ["tres", "uno"]
+
+    def test_append_with_page_ranges(self):
+        session_id = client.post("/merge-sessions").json()["session_id"]
+        files = [
+            ("files", ("a.pdf", make_pdf("a1", "a2", "a3"), "application/pdf")),
+            ("files", ("b.pdf", make_pdf("b1", "b2"), "application/pdf")),
+        ]
+        response = client.post(f"/merge-sessions/{session_id}/files", files=files, data={"pages": ["2-3", ""]})
+        assert response.status_code == 200
+        assert response.json()["total_pages"] == 4
+
+        payload = {"files": [{"data_b64": base64.b64encode(make_pdf("c1", "c2")).decode(), "pages": "2"}]}
+        client.post(f"/merge-sessions/{session_id}/files-json", json=payload)
+
+        response = client.post(f"/merge-sessions/{session_id}/finalize")
+        assert page_texts(response.content) == ["a2", "a3", "b1", "b2", "c2"]
+
+    @pytest.mark.parametrize("option", [{"dedupe_pages": True}, {"compress": True}, {"max_image_px": 800}])
+    def test_files_json_rejects_finalize_options(self, option):
+        # Las opciones de fusión van en /finalize; aquí no se ignoran en silencio.
+        session_id = client.post("/merge-sessions").json()["session_id"]
+        payload = {"files": [{"data_b64": base64.b64encode(make_pdf("uno")).decode()}], **option}
+        response = client.post(f"/merge-sessions/{session_id}/files-json", json=payload)
+        assert response.status_code == 422
+        assert client.get(f"/merge-sessions/{session_id}").json()["files"] == 0
+
+    def test_reorder_out_of_range(self):
+        session_id = client.post("/merge-sessions").json()["session_id"]
+        files = {"files": ("a.pdf", make_pdf("uno"), "application/pdf")}
+        client.post(f"/merge-sessions/{session_id}/files", files=files)
+
+        response = client.put(f"/merge-sessions/{session_id}/pages", json={"pages": [2]})
+        assert response.status_code == 400
+
+    def test_append_invalid_pdf(self):
+        session_id = client.post("/merge-sessions").json()["session_id"]
+        files = {"files": ("a.pdf", b"esto no es un pdf", "application/pdf")}
+
+        response = client.post(f"/merge-sessions/{session_id}/files", files=files)
+        assert response.status_code == 400
+        assert client.get(f"/merge-sessions/{session_id}").json()["total_pages"] == 0
+
+    def test_unknown_session(self):
+        assert client.get("/merge-sessions/" + "0" * 32).status_code == 404
+        assert client.post("/merge-sessions/../etc/finalize").status_code == 404
+
+    def test_finalize_empty_session(self):
+        session_id = client.post("/merge-sessions").json()["session_id"]
+        response = client.post(f"/merge-sessions/{session_id}/finalize")
+        assert response.status_code == 400
+
+    def test_finalized_session_rejects_changes(self, session_dir):
+        # Mientras se envía el PDF finalizado (antes del borrado) la sesión no admite cambios.
+        session_id = client.post("/merge-sessions").json()["session_id"]
+        files = {"files": ("a.pdf", make_pdf("uno", "dos"), "application/pdf")}
+        client.post(f"/merge-sessions/{session_id}/files", files=files)
+        path, total = merge_sessions.finalize_session(session_id)
+        assert total == 2
+        assert os.path.dirname(path) == str(session_dir / session_id)
+
+        assert client.post(f"/merge-sessions/{session_id}/files", files=files).status_code == 409
+        response = client.put(f"/merge-sessions/{session_id}/pages", json={"pages": [1]})
+        assert response.status_code == 409
+        assert client.post(f"/merge-sessions/{session_id}/finalize").status_code == 409
+        assert client.get(f"/merge-sessions/{session_id}").json()["finalized"] is True
+
+        # El PDF ya generado no se pisó.
+        with open(path, "rb") as fh:
+            assert page_texts(fh.read()) == ["uno", "dos"]
+
+    def test_failed_finalize_leaves_session_open(self, session_dir):
+        session_id = client.post("/merge-sessions").json()["session_id"]
+        assert client.post(f"/merge-sessions/{session_id}/finalize").status_code == 400
+        assert client.get(f"/merge-sessions/{session_id}").json()["finalized"] is False
+        assert not [f for f in os.listdir(session_dir / session_id) if f.endswith(".pdf")]
+
+    def test_expired_session(self, monkeypatch, session_dir):
+        session_id = client.post("/merge-sessions").json()["session_id"]
+        monkeypatch.setattr(merge_sessions, "MERGE_SESSION_TTL_SECONDS", 0)
+        time.sleep(0.01)
+
+        assert client.get(f"/merge-sessions/{session_id}").status_code == 404
+        assert not (session_dir / session_id).exists()
+
+
+def _append_from_worker(session_dir, session_id, texto, rounds):
+    merge_sessions.MERGE_SESSION_DIR = session_dir
+    for i in range(rounds):
+        merge_sessions.append_pdfs(session_id, [make_pdf(f"{texto}-{i}")])
+
+
+class TestConcurrentWorkers:
+    def test_appends_from_several_processes(self, session_dir):
+        import multiprocessing
+
+        session_id = merge_sessions.create_session()["session_id"]
+        ctx = multiprocessing.get_context("fork")
+        workers = [
+            ctx.Process(target=_append_from_worker, args=(str(session_dir), session_id, f"w{n}", 5))
+            for n in range(4)
+        ]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join(30)
+        assert [w.exitcode for w in workers] == [0, 0, 0, 0]
+
+        summary = merge_sessions.get_session(session_id)
+        assert summary["files"] == 20
+        assert summary["total_pages"] == 20
+        path, total = merge_sessions.finalize_session(session_id)
+        with open(path, "rb") as fh:
+            textos = page_texts(fh.read())
+        assert total == 20
+        assert sorted(textos) == sorted(f"w{n}-{i}" for n in range(4) for i in range(5))
+        assert not [f for f in os.listdir(session_dir / session_id) if f.endswith(".tmp")]
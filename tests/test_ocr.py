@@ -0,0 +1,141 @@
+import base64
+import struct
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.ocr import OcrProfile, encode_words, get_profile, text_from_words, words_from_data
+
+client = TestClient(app)
+
+# Salida típica de pytesseract.image_to_data(..., output_type=Output.DICT)
+DATA = {
+    "level":     [1, 2, 3, 4, 5, 5, 4, 5, 3, 4, 5],
+    "block_num": [0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+    "par_num":   [0, 0, 1, 1, 1, 1, 1, 1, 2, 2, 2],
+    "line_num":  [0, 0, 0, 1, 1, 1, 2, 2, 0, 1, 1],
+    "word_num":  [0, 0, 0, 0, 1, 2, 0, 1, 0, 0, 1],
+    "left":      [0, 10, 10, 10, 10, 80, 10, 10, 10, 10, 10],
+    "top":       [0, 20, 20, 20, 20, 20, 50, 50, 90, 90, 90],
+    "width":     [600, 200, 200, 200, 60, 90, 120, 120, 70, 70, 70],
+    "height":    [800, 60, 60, 20, 20, 20, 20, 20, 20, 20, 20],
+    "conf":      [-1, -1, -1, -1, 96, 91, -1, 88, -1, -1, 75],
+    "text":      ["", "", "", "", "Juan", "Perez", "", "123456789", "", "", "Firma"],
+}
+
+
+class TestWordsFromData:
+    def test_only_words_kept(self):
+        words = words_from_data(DATA)
+        assert words["text"] == ["Juan", "Perez", "123456789", "Firma"]
+        assert words["left"] == [10, 80, 10, 10]
+        assert words["conf"] == [96, 91, 88, 75]
+        assert words["line"] == [1, 1, 2, 1]
+        assert words["par"] == [1, 1, 1, 2]
+
+    def test_text_rebuilt_from_words(self):
+        assert text_from_words(words_from_data(DATA)) == "Juan Perez\n123456789\n\nFirma"
+
+    def test_empty(self):
+        assert text_from_words(words_from_data({"text": []})) == ""
+
+
+class TestEncodeWords:
+    def test_columnar(self):
+        encoded = encode_words(words_from_data(DATA), "columnar")
+        assert encoded["format"] == "columnar"
+        assert encoded["count"] == 4
+        assert encoded["top"] == [20, 20, 50, 90]
+
+    def test_binary_roundtrip(self):
+        encoded = encode_words(words_from_data(DATA), "binary")
+        raw = base64.b64decode(encoded["data_b64"])
+        n = encoded["count"]
+        assert len(raw) == n * (7 * 2 + 1)
+
+        left = struct.unpack(f"<{n}H", raw[:2 * n])
+        conf = struct.unpack(f"<{n}b", raw[-n:])
+        assert left == (10, 80, 10, 10)
+        assert conf == (96, 91, 88, 75)
+        assert encoded["fields"][0] == "left:u16le"
+
+    def test_unknown_format(self):
+        with pytest.raises(ValueError):
+            encode_words(words_from_data(DATA), "xml")
+
+
+def test_convert_pdf_rejects_unknown_layout():
+    files = {"file": ("a.pdf", b"%PDF-1.4", "application/pdf")}
+    response = client.post("/convert-pdf?layout=xml", files=files)
+    assert response.status_code == 400
+
+
+class TestOcrProfiles:
+    def test_config_string(self):
+        profile = OcrProfile("t", lang="spa", psm=6, oem=1, whitelist="0123456789")
+        assert profile.config == "--psm 6 --oem 1 -c tessedit_char_whitelist=0123456789"
+        assert OcrProfile("vacio").config == ""
+
+    @pytest.mark.parametrize("params", [{"psm": 14}, {"oem": 4}, {"dpi": 20}, {"whitelist": "a b"}])
+    def test_invalid_profile(self, params):
+        with pytest.raises(ValueError):
+            OcrProfile("malo", **params)
+
+    def test_get_profile(self):
+        assert get_profile(None).name == "default"
+        assert get_profile("invoice").lang == "spa"
+        with pytest.raises(ValueError):
+            get_profile("no-existe")
+
+    def test_list_profiles_endpoint(self):
+        data = client.get("/ocr-profiles").json()
+        assert data["default"] == "default"
+        assert data["profiles"]["invoice"]["psm"] == 6
+
+    def test_convert_pdf_rejects_unknown_profile(self):
+        files = {"file": ("a.pdf", b"%PDF-1.4", "application/pdf")}
+        response = client.post("/convert-pdf?profile=no-existe", files=files)
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("path", ["/convert-pdf", "/validar-documento"])
+    def test_profile_resolved_off_event_loop(self, monkeypatch, path):
+        # El primer get_profile ejecuta 'tesseract --list-langs'; no debe bloquear el loop.
+        import asyncio
+        from app import ocr
+
+        in_loop = []
+
+        def fake_get_profile(name):
+            try:
+                asyncio.get_running_loop()
+                in_loop.append(True)
+            except RuntimeError:
+                in_loop.append(False)
+            raise ValueError("perfil no disponible")
+
+        monkeypatch.setattr(ocr, "get_profile", fake_get_profile)
+        files = {"file": ("a.pdf", b"%PDF-1.4", "application/pdf")}
+        data = {"candidatos": '[{"nombre": "Ana", "documento": "1"}]'}
+        response = client.post(path + "?profile=invoice", files=files, data=data)
+        assert response.status_code == 400
+        assert in_loop == [False]
+
+    def test_languages_checked_lazily_once(self, monkeypatch):
+        import pytesseract
+        from app import ocr
+
+        calls = []
+
+        def fake_languages(config=""):
+            calls.append(config)
+            return ["eng", "osd"]
+
+        monkeypatch.setattr(pytesseract, "get_languages", fake_languages)
+        monkeypatch.setattr(ocr, "_languages_checked", False)
+        monkeypatch.setattr(ocr, "UNAVAILABLE_PROFILES", {})
+
+        assert get_profile("digits").name == "digits"
+        with pytest.raises(ValueError, match="no disponible"):
+            get_profile("invoice")
+        assert len(calls) == 1
@@ -0,0 +1,73 @@
+import subprocess
+import sys
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.main import app
+
+
+def wait_ready(client, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get("/ready")
+        if response.status_code == 200:
+            return response
+        time.sleep(0.02)
+    return response
+
+
+class TestReadiness:
+    def test_ready_without_warmup(self, monkeypatch):
+        monkeypatch.setattr(main, "OCR_WARMUP", False)
+        with TestClient(app) as client:
+            response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["warmup"] == "omitido"
+
+    def test_not_ready_until_warmup_finishes(self, monkeypatch):
+        release = threading.Event()
+        monkeypatch.setattr(main, "OCR_WARMUP", True)
+        monkeypatch.setattr(main, "warm_up_engines", lambda: release.wait(5))
+
+        with TestClient(app) as client:
+            assert client.get("/ready").status_code == 503
+            release.set()
+            response = wait_ready(client)
+        assert response.status_code == 200
+        assert response.json()["warmup"] == "ok"
+
+    def test_warmup_failure_still_ready(self, monkeypatch):
+        def fail():
+            raise RuntimeError("tesseract no instalado")
+
+        monkeypatch.setattr(main, "OCR_WARMUP", True)
+        monkeypatch.setattr(main, "warm_up_engines", fail)
+        with TestClient(app) as client:
+            response = wait_ready(client)
+        assert response.status_code == 200
+        assert response.json()["warmup"].startswith("error")
+
+
+def test_warmup_pdf_is_valid():
+    import io
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(main.build_warmup_pdf()), strict=True)
+    assert reader.pages[0].extract_text() == "OCR 123"
+
+
+def test_heavy_modules_not_imported_at_startup():
+    # Arranca la app completa (lifespan incluido) sin precalentamiento.
+    code = (
+        "import os, sys; os.environ['OCR_WARMUP'] = '0'; "
+        "from fastapi.testclient import TestClient; import app.main; "
+        "client = TestClient(app.main.app); client.__enter__(); "
+        "assert client.get('/ready').status_code == 200; "
+        "print(sorted(m for m in ('pdf2image', 'pytesseract', 'pypdf', 'PIL') if m in sys.modules)); "
+        "client.__exit__(None, None, None)"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import tempfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import render, singleflight
+from app.render import spool_pdf
+from app.main import app
+
+client = TestClient(app)
+
+PDF = b"%PDF-1.4 contenido de prueba" * 100
+
+
+@pytest.fixture(autouse=True)
+def spool_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(render, "RENDER_SPOOL_DIR", str(tmp_path))
+    return tmp_path
+
+
+class TestSpoolPdf:
+    def test_bytes_written_once_and_removed(self, spool_dir):
+        with spool_pdf(PDF) as pdf:
+            assert os.path.dirname(pdf.path) == str(spool_dir)
+            assert pdf.size == len(PDF)
+            assert pdf.sha256 == hashlib.sha256(PDF).hexdigest()
+            with open(pdf.path, "rb") as fh:
+                assert fh.read() == PDF
+        assert not os.listdir(spool_dir)
+
+    def test_in_memory_upload_is_copied(self, spool_dir):
+        src = tempfile.SpooledTemporaryFile(max_size=len(PDF) * 2)
+        src.write(PDF)
+        with spool_pdf(src) as pdf:
+            assert os.path.dirname(pdf.path) == str(spool_dir)
+            assert pdf.sha256 == hashlib.sha256(PDF).hexdigest()
+            assert src.read() == PDF  # El upload queda rebobinado
+        assert not os.listdir(spool_dir)
+
+    @pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="requiere /proc")
+    def test_rolled_upload_is_reused(self, spool_dir):
+        src = tempfile.SpooledTemporaryFile(max_size=10)
+        src.write(PDF)
+        with spool_pdf(src) as pdf:
+            assert pdf.path.startswith("/proc/")
+            assert pdf.size == len(PDF)
+            with open(pdf.path, "rb") as fh:
+                assert fh.read() == PDF
+        assert not os.listdir(spool_dir)
+        assert not src.closed
+
+    def test_without_rolled_attribute_falls_back_to_copy(self, spool_dir):
+        # Si una versión de Python deja de tener SpooledTemporaryFile._rolled, se copia.
+        src = tempfile.SpooledTemporaryFile(max_size=10)
+        src.write(PDF)
+        del src._rolled
+        with spool_pdf(src) as pdf:
+            assert os.path.dirname(pdf.path) == str(spool_dir)
+            with open(pdf.path, "rb") as fh:
+                assert fh.read() == PDF
+        assert not os.listdir(spool_dir)
+
+    @pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="requiere /proc")
+    def test_plain_temporary_file_is_reused(self, spool_dir):
+        with tempfile.TemporaryFile() as src:
+            src.write(PDF)
+            with spool_pdf(src) as pdf:
+                assert pdf.path.startswith("/proc/")
+                assert pdf.sha256 == hashlib.sha256(PDF).hexdigest()
+        assert not os.listdir(spool_dir)
+
+    def test_reuse_can_be_disabled(self, spool_dir, monkeypatch):
+        monkeypatch.setattr(render, "RENDER_REUSE_UPLOAD_SPOOL", False)
+        src = tempfile.SpooledTemporaryFile(max_size=10)
+        src.write(PDF)
+        with spool_pdf(src) as pdf:
+            assert os.path.dirname(pdf.path) == str(spool_dir)
+
+
+class TestEndpointsUseSpoolFile:
+    def test_convert_pdf_renders_from_path(self, spool_dir, monkeypatch):
+        import app.main as main
+
+        monkeypatch.setattr(singleflight, "SINGLEFLIGHT_DIR", str(spool_dir / "inflight"))
+        seen = []
+
+        def fake_ocr_page(pdf_path, page, dpi, timeout, layout, profile):
+            with open(pdf_path, "rb") as fh:
+                seen.append((pdf_path, fh.read()))
+            return {"text": f"pagina {page}"}
+
+        monkeypatch.setattr(main, "check_pdf_pages", lambda pdf_path: 2)
+        monkeypatch.setattr(main, "ocr_page", fake_ocr_page)
+        response = client.post("/convert-pdf", files={"file": ("a.pdf", PDF, "application/pdf")})
+        assert response.status_code == 200
+
+        # Las dos páginas se renderizan desde el mismo archivo, sin copiar el PDF por página.
+        assert len({path for path, _ in seen}) == 1
+        assert all(data == PDF for _, data in seen)
+        assert not [f for f in os.listdir(spool_dir) if f.endswith(".pdf")]
+
+    def test_pdf_to_images_uses_poppler_jpeg(self, monkeypatch):
+        calls = []
+
+        def fake_render(pdf_path, dpi, quality):
+            calls.append((dpi, quality))
+            return ["QUJD"]
+
+        monkeypatch.setattr(render, "render_pages_jpeg_b64", fake_render)
+        response = client.post("/pdf-to-images", files={"file": ("a.pdf", PDF, "application/pdf")})
+        assert response.status_code == 200
+        assert response.json()["images"] == ["data:image/jpeg;base64,QUJD"]
+        assert calls == [(200, 85)]
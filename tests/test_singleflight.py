@@ -0,0 +1,174 @@
+import asyncio
+import fcntl
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import singleflight
+from app.main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def inflight_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_DIR", str(tmp_path))
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_POLL_SECONDS", 0.01)
+    return tmp_path
+
+
+def hold_lock(inflight_dir, key="k"):
+    """Simula otro worker con el trabajo en curso: lock tomado con flock."""
+    fd = os.open(str(inflight_dir / f"{key}.lock"), os.O_CREAT | os.O_RDWR)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    return fd
+
+
+class TestRunOnce:
+    def test_concurrent_calls_run_once(self):
+        calls = []
+
+        async def factory():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"texto": "hola"}
+
+        async def main():
+            return await asyncio.gather(*(singleflight.run_once("k", factory, 5) for _ in range(5)))
+
+        results = asyncio.run(main())
+        assert len(calls) == 1
+        assert all(r == {"texto": "hola"} for r, _ in results)
+        assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+        assert not os.path.exists(singleflight._path("k", "lock"))
+
+    def test_waits_for_result_of_other_worker(self, inflight_dir):
+        # Otro worker tiene el lock; publica el resultado y lo suelta más tarde.
+        fd = hold_lock(inflight_dir)
+
+        async def other_worker():
+            await asyncio.sleep(0.05)
+            singleflight._write_result("k", {"texto": "del otro"})
+            os.remove(singleflight._path("k", "lock"))
+            os.close(fd)
+
+        async def factory():
+            raise AssertionError("no debería ejecutarse")
+
+        async def main():
+            asyncio.ensure_future(other_worker())
+            return await singleflight.run_once("k", factory, 5)
+
+        assert asyncio.run(main()) == ({"texto": "del otro"}, True)
+
+    def test_takes_over_when_leader_fails(self, inflight_dir):
+        fd = hold_lock(inflight_dir)
+
+        async def failed_worker():
+            await asyncio.sleep(0.05)
+            os.remove(singleflight._path("k", "lock"))
+            os.close(fd)
+
+        async def factory():
+            return {"texto": "propio"}
+
+        async def main():
+            asyncio.ensure_future(failed_worker())
+            return await singleflight.run_once("k", factory, 5)
+
+        assert asyncio.run(main()) == ({"texto": "propio"}, False)
+
+    def test_lock_of_dead_worker_is_taken_over(self, inflight_dir):
+        # Un worker muerto deja el archivo con su pid, pero el kernel ya liberó su flock.
+        (inflight_dir / "k.lock").write_text("999999")
+
+        async def factory():
+            return {"texto": "propio"}
+
+        result = asyncio.run(singleflight.run_once("k", factory, 0.05))
+        assert result == ({"texto": "propio"}, False)
+        assert not (inflight_dir / "k.lock").exists()
+
+    def test_lock_released_when_worker_process_dies(self, inflight_dir):
+        import multiprocessing
+        import signal
+
+        ctx = multiprocessing.get_context("fork")
+        ready = ctx.Event()
+
+        def worker():
+            assert singleflight._try_lock("k")
+            ready.set()
+            time.sleep(60)
+
+        proc = ctx.Process(target=worker)
+        proc.start()
+        try:
+            assert ready.wait(10)
+
+            async def factory():
+                return {"texto": "propio"}
+
+            with pytest.raises(singleflight.SingleFlightTimeout):
+                asyncio.run(singleflight.run_once("k", factory, 0.05))
+        finally:
+            os.kill(proc.pid, signal.SIGKILL)
+            proc.join(10)
+        assert asyncio.run(singleflight.run_once("k", factory, 0.05)) == ({"texto": "propio"}, False)
+
+    def test_purge_keeps_held_locks(self, inflight_dir):
+        fd = hold_lock(inflight_dir, "ocupado")
+        (inflight_dir / "abandonado.lock").write_text("999999")
+        old = time.time() - 3600
+        for name in ("ocupado.lock", "abandonado.lock"):
+            os.utime(inflight_dir / name, (old, old))
+        try:
+            singleflight.purge_stale_files()
+            assert (inflight_dir / "ocupado.lock").exists()
+            assert not (inflight_dir / "abandonado.lock").exists()
+        finally:
+            os.close(fd)
+
+    def test_timeout_waiting(self, inflight_dir):
+        fd = hold_lock(inflight_dir)
+
+        async def factory():
+            return {}
+
+        try:
+            with pytest.raises(singleflight.SingleFlightTimeout):
+                asyncio.run(singleflight.run_once("k", factory, 0.05))
+        finally:
+            os.close(fd)
+
+    def test_expired_result_is_not_reused(self, inflight_dir):
+        singleflight._write_result("k", {"texto": "viejo"})
+        old = time.time() - 3600
+        os.utime(singleflight._path("k", "json"), (old, old))
+
+        async def factory():
+            return {"texto": "nuevo"}
+
+        assert asyncio.run(singleflight.run_once("k", factory, 5)) == ({"texto": "nuevo"}, False)
+
+
+class TestEndpointConvertPdfSingleFlight:
+    def test_shared_result_header(self, monkeypatch):
+        import app.main as main
+
+        monkeypatch.setattr(main, "check_pdf_pages", lambda pdf_path: 1)
+        monkeypatch.setattr(main, "ocr_page", lambda *args, **kwargs: {"text": "pagina"})
+        files = {"file": ("a.pdf", b"%PDF-1.4 single-flight", "application/pdf")}
+
+        first = client.post("/convert-pdf", files=files)
+        assert first.status_code == 200
+        assert first.headers["X-OCR-Shared"] == "false"
+
+        # Resultado aún publicado para los que esperaban: se reutiliza sin repetir el OCR.
+        monkeypatch.setattr(main, "ocr_page", lambda *args, **kwargs: pytest.fail("OCR repetido"))
+        second = client.post("/convert-pdf", files=files)
+        assert second.status_code == 200
+        assert second.headers["X-OCR-Shared"] == "true"
+        assert second.json() == first.json()
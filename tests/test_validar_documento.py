@@ -0,0 +1,64 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    """Sustituye el render + OCR por texto fijo por página y registra qué páginas se procesaron."""
+    textos = {1: "Factura de servicios", 2: "Paciente Juan Perez CC 123456789", 3: "Anexo", 4: "Anexo"}
+    procesadas = []
+
+    def fake_iter(pdf_path, total_pages, layout=None, profile=None, deadline=None):
+        for page in range(1, total_pages + 1):
+            procesadas.append(page)
+            yield {"page": page, "text": textos[page]}
+
+    monkeypatch.setattr(main, "check_pdf_pages", lambda pdf_path: len(textos))
+    monkeypatch.setattr(main, "iter_ocr_pages", fake_iter)
+    return procesadas
+
+
+class TestEndpointValidarDocumento:
+    def test_early_stop(self, fake_ocr):
+        data = {"candidatos": json.dumps([{"nombre": "juan perez", "documento": "123456789"}])}
+        files = {"file": ("a.pdf", b"%PDF-1.4", "application/pdf")}
+        response = client.post("/validar-documento", files=files, data=data)
+        assert response.status_code == 200
+
+        body = response.json()
+        assert body["total_paginas"] == 4
+        assert body["paginas_procesadas"] == 2
+        assert body["detenido_anticipadamente"] is True
+        assert body["resultados"][0]["score"] == 100
+        assert body["resultados"][0]["pagina"] == 2
+        assert fake_ocr == [1, 2]
+
+    def test_candidate_not_found(self, fake_ocr):
+        data = {
+            "candidatos": json.dumps([
+                {"nombre": "juan perez", "documento": "123456789"},
+                {"nombre": "maria lopez", "documento": "987654321"},
+            ]),
+            "umbral": "80",
+        }
+        files = {"file": ("a.pdf", b"%PDF-1.4", "application/pdf")}
+        body = client.post("/validar-documento", files=files, data=data).json()
+        assert body["paginas_procesadas"] == 4
+        assert [r["aprobado"] for r in body["resultados"]] == [True, False]
+
+    def test_invalid_candidates(self):
+        files = {"file": ("a.pdf", b"%PDF-1.4", "application/pdf")}
+        response = client.post("/validar-documento", files=files, data={"candidatos": '[{"nombre": "x"}]'})
+        assert response.status_code == 422
+
+    def test_empty_candidates(self):
+        files = {"file": ("a.pdf", b"%PDF-1.4", "application/pdf")}
+        response = client.post("/validar-documento", files=files, data={"candidatos": "[]"})
+        assert response.status_code == 400